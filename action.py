@@ -1,4 +1,10 @@
 """Module for wrapping basic actions of the slack bot."""
+from collections.abc import Mapping
+from types import MappingProxyType
+import time
+import metrics
+import timings
+import utils
 
 
 def speak(client, channel, message, user=''):
@@ -16,6 +22,8 @@ def speak(client, channel, message, user=''):
         User to directly message
 
     """
+    if metrics.enabled:
+        metrics.inc('speak_total')
     user = '<@{0}> '.format(user) if user != '' else ''
     message = '{0}{1}'.format(user, message)
     client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
@@ -26,7 +34,74 @@ class ActionInputError(Exception):
     pass
 
 
-def act(arguments, actions):
+class Context(object):
+    """Placeholder for an argument of an action that is only known when the action is called.
+
+    Attributes
+    ----------
+    name : str
+        Key of the value in the context that is given to `act`.
+
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Context({0!r})'.format(self.name)
+
+
+def compile_actions(actions):
+    """Compile the nested dictionary of actions into an immutable trie.
+
+    Each level of the dictionary is checked once and is given the 'error' key if it does not have
+    one already, so that `act` does not need to rebuild the actions for every message.
+
+    Parameters
+    ----------
+    actions : dict
+        Actions that corresponds to the given arguments.
+        See `act` for the structure of the actions.
+        Arguments of the functions that are only known when the action is called can be given as
+        instances of `Context`.
+
+    Returns
+    -------
+    actions : types.MappingProxyType
+        Read-only nested mappings of the actions.
+
+    Raises
+    ------
+    ValueError
+        If the given actions does not have the structure described in `act`.
+
+    """
+    if isinstance(actions, Mapping):
+        keys = [key for key in actions.keys() if key not in ['error', None]]
+        compiled = {key: compile_actions(actions[key]) for key in actions.keys() if key != 'error'}
+        compiled['error'] = actions.get('error',
+                                        'The last keyword must be one of {0}.'
+                                        ''.format(utils.nice_options(keys, end_delimiter='or',
+                                                                     last_comma=True, quote='`')))
+        return MappingProxyType(compiled)
+    elif isinstance(actions, (tuple, list)):
+        if not isinstance(actions[0], str):
+            # FIXME: wording
+            raise ValueError('First entry in the list of actions must be the documentation for '
+                             'executing the function.')
+        elif not hasattr(actions[1], '__call__'):
+            # FIXME: wording
+            raise ValueError('Second entry in the list of actions must be the executed function.')
+        return tuple(actions)
+    elif isinstance(actions, str):
+        return actions
+    else:
+        # FIXME: wording
+        raise ValueError('Cannot understand the given structure of actions.')
+
+
+def act(arguments, actions, context=None):
     """Executes appropriate actions given the string arguments.
 
     Parameters
@@ -42,22 +117,53 @@ def act(arguments, actions):
         The values are the action that will be executed. It will be a function that requires no
         arguments (this function will be executed without arguments).
         Each level of action must contain an error key that handles the action upon bad input.
+        A level can contain the key None for the action that is executed when the argument does
+        not match any other key. The argument is then passed on to that action.
+    context : dict
+        Values of the arguments that are given as instances of `Context` in the actions.
 
     Raises
     ------
     ValueError
         If the given actions does not contain the key 'error'.
 
+    Notes
+    -----
+    If `timings` is enabled, the time taken to find the action (`lookup`) and to run it (`run`) is
+    recorded under the path of the command, e.g. `money list`, along with the stages that are
+    accumulated while the command runs, e.g. `sql`.
+
     """
-    try:
-        contents = actions[arguments[0].lower()]
-        # here, IndexError is raised if arguments is empty
-        # then, KeyError is raised if given argument is not a key in actions
-    except (KeyError, IndexError):
-        if 'error' not in actions:
-            raise ValueError('The provided set of actions must contain the key `error` to handle '
-                             'behaviour when bad arguments are provided:\n{0}'.format(actions))
-        raise ActionInputError(actions['error'])
+    # the stages are timed only if timing was on when the command started
+    timed = timings.enabled
+    if timed:
+        start = time.perf_counter()
+    path = []
+    while True:
+        try:
+            contents = actions[arguments[0].lower()]
+            path.append(arguments[0].lower())
+            # here, IndexError is raised if arguments is empty
+            # then, KeyError is raised if given argument is not a key in actions
+        except (KeyError, IndexError):
+            if None in actions:
+                contents = actions[None]
+                arguments = [None] + list(arguments)
+                path.append('*')
+            elif 'error' not in actions:
+                raise ValueError('The provided set of actions must contain the key `error` to '
+                                 'handle behaviour when bad arguments are provided:\n{0}'
+                                 ''.format(actions))
+            else:
+                if timed:
+                    timings.record(' '.join(path), 'lookup', time.perf_counter() - start)
+                    timings.end(timings.begin(' '.join(path)))
+                raise ActionInputError(actions['error'])
+        if not isinstance(contents, Mapping):
+            break
+        actions = contents
+        arguments = arguments[1:]
+    key = ' '.join(path)
 
     if isinstance(contents, (tuple, list)):
         doc, func = contents[:2]
@@ -69,16 +175,37 @@ def act(arguments, actions):
         elif not hasattr(func, '__call__'):
             # FIXME: wording
             raise ValueError('Second entry in the list of actions must be the executed function.')
+        if timed:
+            now = time.perf_counter()
+            timings.record(key, 'lookup', now - start)
+            start = now
+            previous = timings.begin(key)
+        if metrics.enabled:
+            metrics.inc('commands_total', command=key)
         try:
-            args = default_args + arguments[1:]
+            if context is not None:
+                default_args = [context[i.name] if isinstance(i, Context) else i
+                                for i in default_args]
+            args = list(default_args) + list(arguments[1:])
             func(*args)
             # TypeError is raised if wrong number of arguments are provided to the method
         except TypeError:
             raise ActionInputError(doc)
+        except ActionInputError:
+            raise
+        except Exception:
+            if metrics.enabled:
+                metrics.inc('command_errors_total', command=key)
+            raise
+        finally:
+            if timed:
+                timings.record(key, 'run', time.perf_counter() - start)
+                timings.end(previous)
     elif isinstance(contents, str):
+        if timed:
+            timings.record(key, 'lookup', time.perf_counter() - start)
+            timings.end(timings.begin(key))
         raise ActionInputError(contents)
-    elif isinstance(contents, dict):
-        act(arguments[1:], contents)
     else:
         # FIXME: wording
         raise ValueError('Cannot understand the given structure of actions.')
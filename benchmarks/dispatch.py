@@ -0,0 +1,61 @@
+"""Benchmark the cost of dispatching a message through the commands of the bot.
+
+Compares rebuilding the actions for every message (as live.py used to do) against walking the
+trie that is compiled once in `commands`.
+
+Run from the root of the repository with `python benchmarks/dispatch.py`.
+
+"""
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import action  # noqa: E402
+import commands  # noqa: E402
+import utils  # noqa: E402
+
+# arguments that stop at each level of the trie without running the command
+ARGUMENTS = [['door', 'close'], ['members', 'remove'], ['money', 'pay'], ['hello'], []]
+CONTEXT = {'slack_client': None,
+           'db_conn': None,
+           'readable_user': 'someone',
+           'msg': {'message': '', 'user': 'U0', 'channel': 'C0', 'time': '0'},
+           'shush_channel': 'C1'}
+
+
+def bind(actions, context):
+    """Copy the declared actions with the context filled in, as live.py used to for each message."""
+    if isinstance(actions, dict):
+        return {key: bind(val, context) for key, val in actions.items()}
+    elif isinstance(actions, list):
+        return [context[i.name] if isinstance(i, action.Context) else i for i in actions]
+    return actions
+
+
+def dispatch_rebuilt():
+    """Dispatch every argument after rebuilding the actions."""
+    for arguments in ARGUMENTS:
+        actions = bind(commands.declared, CONTEXT)
+        utils.make_errors(actions, None)
+        try:
+            action.act(arguments, actions)
+        except action.ActionInputError:
+            pass
+
+
+def dispatch_compiled():
+    """Dispatch every argument through the compiled actions."""
+    for arguments in ARGUMENTS:
+        try:
+            action.act(arguments, commands.actions, CONTEXT)
+        except action.ActionInputError:
+            pass
+
+
+if __name__ == "__main__":
+    number = 2000
+    for func in [dispatch_rebuilt, dispatch_compiled]:
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print('{0:<20}{1:>10.2f} us per message'.format(func.__name__,
+                                                        best / number / len(ARGUMENTS) * 1e6))
@@ -0,0 +1,45 @@
+"""Benchmark the time between a request to open the door and the relay turning on.
+
+The relay is replaced by `door.FakeRelay`, so that this runs without a Raspberry Pi.
+
+Run from the root of the repository with `python benchmarks/door.py`.
+
+"""
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import door  # noqa: E402
+
+
+def wait_for(relay, count, timeout=5.0):
+    """Wait until the relay has changed the given number of times."""
+    end = time.monotonic() + timeout
+    while len(relay.changes) < count and time.monotonic() < end:
+        time.sleep(0.0001)
+
+
+if __name__ == "__main__":
+    relay = door.FakeRelay()
+    actuator = door.DoorActuator(relay, pulse=0.01)
+    actuator.start()
+    for _ in range(200):
+        actuator.open()
+        wait_for(relay, len(relay.changes) + 2)
+    latencies = sorted(actuator.latencies)
+    median = latencies[len(latencies) // 2]
+    print('{0:<24}{1:>10.3f} ms'.format('median open latency', median * 1e3))
+    print('{0:<24}{1:>10.3f} ms'.format('max open latency', latencies[-1] * 1e3))
+
+    # overlapping requests keep the relay on instead of toggling it
+    relay.changes.clear()
+    actuator.pulse = 0.05
+    start = time.monotonic()
+    for _ in range(10):
+        actuator.open()
+        time.sleep(0.02)
+    wait_for(relay, 2)
+    print('{0:<24}{1:>10}'.format('changes for 10 opens', len(relay.changes)))
+    print('{0:<24}{1:>10.3f} s'.format('relay on for', relay.changes[-1][0] - relay.changes[0][0]))
+    actuator.stop()
@@ -0,0 +1,55 @@
+"""Benchmark hearing bursts of RTM events with `bot/ear.py`.
+
+Run from the root of the repository with `python benchmarks/ear.py`.
+
+"""
+import importlib.util
+import os
+import random
+import time
+
+# bot/ear.py is loaded on its own so that the rest of the bot package is not needed
+EAR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot',
+                        'ear.py')
+spec = importlib.util.spec_from_file_location('ear', EAR_PATH)
+ear = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ear)
+
+HOST = '<@UBOT>'
+
+
+def burst(num_events, seed=0):
+    """Return a list of random RTM events, some of which mention the bot or are malformed."""
+    rng = random.Random(seed)
+    events = []
+    for i in range(num_events):
+        roll = rng.random()
+        if roll < 0.05:
+            events.append(rng.choice([None, 'text', {'type': 'presence_change', 'user': 'U1'},
+                                      {'type': 'message', 'text': None, 'channel': 'C1',
+                                       'user': 'U1', 'ts': '1'}]))
+            continue
+        text = 'money list {0}'.format(i)
+        if roll < 0.5:
+            text = '{0} {1}'.format(HOST, text)
+        if roll < 0.1:
+            text = '{0} <@UBOT|bot> again'.format(text)
+        events.append({'type': 'message', 'channel': 'C{0}'.format(rng.randrange(10)),
+                       'user': 'U{0}'.format(rng.randrange(50)), 'text': text,
+                       'ts': '{0}.{1:06d}'.format(1500000000 + i, i)})
+    return events
+
+
+if __name__ == "__main__":
+    print('{0:>8}{1:>8}{2:>8}{3:>14}{4:>14}'.format('events', 'heard', 'dm', 'per burst',
+                                                    'events/s'))
+    for num_events in [10, 100, 500, 1000]:
+        events = burst(num_events)
+        repeats = max(1, 20000 // num_events)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            sounds = list(ear.all_messages(HOST, events))
+        elapsed = (time.perf_counter() - start) / repeats
+        print('{0:>8}{1:>8}{2:>8}{3:>12.1f}us{4:>14.0f}'.format(
+            num_events, len(sounds), sum(i.dm for i in sounds), elapsed * 1e6,
+            num_events / elapsed))
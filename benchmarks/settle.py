@@ -0,0 +1,48 @@
+"""Benchmark settling synthetic ledgers with `money settle`.
+
+Run from the root of the repository with `python benchmarks/settle.py`.
+
+"""
+import os
+import random
+import sqlite3
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+import money  # noqa: E402
+
+
+def ledger(num_people, num_receipts, seed=0):
+    """Return an in-memory database with random receipts between the given number of people."""
+    rng = random.Random(seed)
+    db_conn = sqlite3.connect(':memory:')
+    migrations.migrate(db_conn)
+    people = ['person{0}'.format(i) for i in range(num_people)]
+    db_conn.executemany('INSERT INTO members (name, userid, slack_id) VALUES (?,?,?)',
+                        [(i.title(), i, 'U{0}'.format(i)) for i in people])
+    rows = []
+    for _ in range(num_receipts):
+        lender, debtor = rng.sample(people, 2)
+        rows.append((lender, debtor, round(rng.uniform(1, 100), 2), 'lunch', 'yes', 'yes',
+                     rng.choice(['yes', 'no']), 'no'))
+    db_conn.executemany('INSERT INTO money (lender, debtor, amount, description, '
+                        'confirm_lender_receipt, confirm_debtor_receipt, confirm_lender_payment, '
+                        'confirm_debtor_payment) VALUES (?,?,?,?,?,?,?,?)', rows)
+    db_conn.commit()
+    return db_conn
+
+
+if __name__ == "__main__":
+    print('{0:>8}{1:>10}{2:>12}{3:>12}{4:>12}'.format('people', 'receipts', 'transfers',
+                                                      'balances', 'transfers'))
+    for num_people, num_receipts in [(20, 1000), (50, 10000), (200, 100000)]:
+        db_conn = ledger(num_people, num_receipts)
+        start = time.perf_counter()
+        owed = money.balances(db_conn)
+        middle = time.perf_counter()
+        plan = money.transfers(owed)
+        end = time.perf_counter()
+        print('{0:>8}{1:>10}{2:>12}{3:>10.1f}ms{4:>10.1f}ms'.format(
+            num_people, num_receipts, len(plan), (middle - start) * 1e3, (end - middle) * 1e3))
@@ -0,0 +1,210 @@
+"""Benchmark the hot paths of the bot against a temporary database of synthetic data.
+
+The database is filled with members, receipts and group meetings, and the Slack client is replaced
+with one that answers every call without a network. The timings are written as JSON.
+
+Run from the root of the repository with `python benchmarks/suite.py [--output results.json]`.
+
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import types
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import action  # noqa: E402
+import commands  # noqa: E402
+import members  # noqa: E402
+import migrations  # noqa: E402
+import money  # noqa: E402
+import utils  # noqa: E402
+
+
+class FakeSlackClient(object):
+    """Slack client that answers every Web API call without a network.
+
+    Attributes
+    ----------
+    calls : int
+        Number of calls that were made.
+
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def api_call(self, method, **kwargs):
+        self.calls += 1
+        if method == 'im.open':
+            return {'ok': True, 'channel': {'id': 'D' + kwargs.get('user', '')}}
+        return {'ok': True, 'ts': '{0:.6f}'.format(time.time())}
+
+
+def populate(db_conn, num_members, num_receipts, num_meetings, log_years, seed=0):
+    """Fill the database with random members, receipts, group meetings and door and quiet logs."""
+    rng = random.Random(seed)
+    people = ['person{0}'.format(i) for i in range(num_members)]
+    db_conn.executemany('INSERT INTO members (name, userid, slack_id, permission) '
+                        'VALUES (?,?,?,?)',
+                        [(i.title(), i, 'U{0}'.format(i), 'admin' if j % 50 == 0 else 'user')
+                         for j, i in enumerate(people)])
+    rows = []
+    for _ in range(num_receipts):
+        lender, debtor = rng.sample(people, 2)
+        rows.append((lender, debtor, round(rng.uniform(1, 100), 2), 'lunch',
+                     *[rng.choice(['yes', 'no']) for _ in range(4)]))
+    db_conn.executemany('INSERT INTO money (lender, debtor, amount, description, '
+                        'confirm_lender_receipt, confirm_debtor_receipt, confirm_lender_payment, '
+                        'confirm_debtor_payment) VALUES (?,?,?,?,?,?,?,?)', rows)
+    first = datetime.date.today() - datetime.timedelta(weeks=num_meetings - 10)
+    db_conn.executemany('INSERT INTO group_meetings (date, presenter, chair, title) '
+                        'VALUES (?,?,?,?)',
+                        [((first + datetime.timedelta(weeks=i)).isoformat(),
+                          rng.randrange(1, num_members + 1), rng.randrange(1, num_members + 1),
+                          'talk {0}'.format(i)) for i in range(num_meetings)])
+    # about 30 door openings and 2 shushes a day
+    start = datetime.datetime.now() - datetime.timedelta(days=365 * log_years)
+    seconds = 365 * log_years * 86400
+    for table, per_day in [('doorlog', 30), ('quietlog', 2)]:
+        times = sorted(rng.uniform(0, seconds) for _ in range(int(365 * log_years * per_day)))
+        db_conn.executemany('INSERT INTO {0} (time, userid) VALUES (?,?)'.format(table),
+                            [(migrations.format_time(start + datetime.timedelta(seconds=i)),
+                              rng.choice(people)) for i in times])
+    db_conn.commit()
+    return people
+
+
+def load_group_meeting():
+    """Return the GroupMeeting class of the bot package and how it was imported.
+
+    The bot package does not have its `action` and `utils` modules, so that it cannot be imported.
+    In that case, `bot.group_meeting` is imported on its own, with stand-ins for `bot.action` and
+    `bot.utils`, so that its queries can still be timed.
+
+    """
+    try:
+        from bot.group_meeting import GroupMeeting
+        return GroupMeeting, 'bot'
+    except ImportError:
+        pass
+    for name in [i for i in sys.modules if i == 'bot' or i.startswith('bot.')]:
+        del sys.modules[name]
+    package = types.ModuleType('bot')
+    package.__path__ = [os.path.join(ROOT, 'bot')]
+    bot_action = types.ModuleType('bot.action')
+    bot_action.Action = type('Action', (object,), {})
+    bot_action.BadInput = type('BadInput', (Exception,), {})
+    bot_action.Messaging = type('Messaging', (Exception,), {})
+    bot_utils = types.ModuleType('bot.utils')
+    bot_utils.nice_options = utils.nice_options
+    bot_utils.where_from_identifiers = utils.where_from_identifiers
+    sys.modules.update({'bot': package, 'bot.action': bot_action, 'bot.utils': bot_utils})
+    from bot.group_meeting import GroupMeeting
+    return GroupMeeting, 'stand-ins'
+
+
+def measure(func, repeat):
+    """Time the given function and return the summary of the timings in microseconds.
+
+    Errors that are the replies of the bot (ActionInputError) are part of the normal flow of the
+    commands and are ignored.
+
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func()
+        except action.ActionInputError:
+            pass
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {'repeat': repeat,
+            'mean_us': sum(timings) / repeat,
+            'p50_us': timings[repeat // 2],
+            'p95_us': timings[min(repeat - 1, int(repeat * 0.95))],
+            'min_us': timings[0],
+            'max_us': timings[-1]}
+
+
+def run(num_members, num_receipts, num_meetings, log_years, repeat, seed=0):
+    """Run every benchmark and return the results."""
+    directory = tempfile.mkdtemp(prefix='ayerslab_bench')
+    try:
+        db_conn = sqlite3.connect(os.path.join(directory, 'bench.db'))
+        migrations.migrate(db_conn)
+        people = populate(db_conn, num_members, num_receipts, num_meetings, log_years, seed)
+        client = FakeSlackClient()
+        rng = random.Random(seed)
+        user = people[1]
+        # people that share a receipt with the user, so that there is something to remind about
+        partners = [i[0] for i in db_conn.execute('SELECT debtor FROM money WHERE lender=? UNION '
+                                                  'SELECT lender FROM money WHERE debtor=?',
+                                                  (user, user))]
+        context = {'slack_client': client,
+                   'db_conn': db_conn,
+                   'readable_user': user,
+                   'msg': {'message': '', 'user': 'U' + user, 'channel': 'C0', 'time': '0'},
+                   'shush_channel': 'C1'}
+
+        benchmarks = {
+            'members.has_permission':
+            lambda: members.has_permission(db_conn.cursor(), rng.choice(people)),
+            'money.list': lambda: money.list(db_conn, rng.choice(people)),
+            'money.remind': lambda: money.remind(client, db_conn, user, rng.choice(partners)),
+            'action.act': lambda: action.act(['money', 'list', '5'], commands.actions, context),
+        }
+        GroupMeeting, group_meeting_source = load_group_meeting()
+        meetings = GroupMeeting(db_conn)
+        today = datetime.date.today()
+        benchmarks['GroupMeeting.select_member_random'] = (
+            lambda: meetings.select_member_random(today, rng.choice(['presenter', 'chair'])))
+        benchmarks['GroupMeeting.list'] = lambda: _ignore_reply(meetings.list, 'last')
+
+        results = {name: measure(func, repeat) for name, func in benchmarks.items()}
+        log_rows = {table: db_conn.execute('SELECT COUNT(*) FROM {0}'.format(table)).fetchone()[0]
+                    for table in ['doorlog', 'quietlog']}
+        db_conn.close()
+    finally:
+        shutil.rmtree(directory)
+    return {'members': num_members,
+            'receipts': num_receipts,
+            'meetings': num_meetings,
+            'log_rows': log_rows,
+            'slack_calls': client.calls,
+            'group_meeting': group_meeting_source,
+            'results': results}
+
+
+def _ignore_reply(func, *args):
+    """Run the action of the bot package, ignoring the reply that it raises."""
+    try:
+        func(*args)
+    except Exception as error:
+        if type(error).__name__ != 'Messaging':
+            raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--receipts', type=int, default=100000)
+    parser.add_argument('--meetings', type=int, default=500)
+    parser.add_argument('--log-years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output', help='File to which the JSON is written. Default is stdout.')
+    args = parser.parse_args()
+
+    report = run(args.members, args.receipts, args.meetings, args.log_years, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
@@ -48,12 +48,16 @@ can be nested (Take first inputs for organization, then inputs for the function)
 
 """
 import shlex
-import sqlite3
+from channels import ChannelDirectory
+from database import Database
+import migrations
+from outbox import Outbox
 from . import ear
 from . import mouth
 from .action import BadInput, Messaging
-from .timed_action import TimedAction
+from .timed_action import TimedAction, TimedActionStore
 from .interactive_action import InteractiveAction
+from .session import SessionStore
 from .members import GroupMember
 from .group_meeting import GroupMeeting
 from .utils import nice_options
@@ -65,51 +69,63 @@ class Brain(object):
     ---------
     bot_id : str
         User name of bot within Slack client
-    slack_client : slack.SlackClient
+    slack_client : outbox.Outbox
         Slack client within which bot lives
+        Messages are queued and sent from a separate thread
+    channels : channels.ChannelDirectory
+        Cache of the channels in the Slack client
+    db_conn : database.Database
+        Connections to ayerslab.db, one for each thread
     actions : dict
         Dictionary of action names to instances of Action
-    timed_actions : dict
-        Dictionary of (instance of Action, option, inputs, interval) to last time
-        process has run
+    timed_actions : TimedActionStore
         Stores processes that will be repeated in some time interval
-    commands : dict
-        Dictionary of channel to (userid, last input, time)
+        Queued by the time they are next due and saved in the database
+    commands : session.SessionStore
+        Command that is being put together in each channel
+    conversations : session.SessionStore
+        Conversation that was started by the bot in each channel
 
     """
     def __init__(self, bot_id, slack_client, status_channel):
         self.bot_id = bot_id
-        self.slack_client = slack_client
-        self.db_conn = sqlite3.connect('ayerslab.db')
-        self.cursor = self.db_conn.cursor()
+        # messages are posted from a queue so that processing does not wait on Slack
+        self.slack_client = Outbox(slack_client)
+        self.slack_client.start()
+        self.channels = ChannelDirectory(slack_client)
+        # one connection for each thread, shared by the actions and the timed actions
+        self.db_conn = Database('ayerslab.db')
+        migrations.migrate(self.db_conn)
         self.actions = {i.name:i for i in [GroupMember(self, self.db_conn),
                                            TimedAction(self),
                                            InteractiveAction(self),
                                            GroupMeeting(self.db_conn),]}
 
-        # FIXME: move this to TimedActions
-        self.timed_actions = {}
-        self.commands = {}
-        self.conversations = {}
+        self.timed_actions = TimedActionStore(self.db_conn)
+        # conversations that are not continued for ten minutes are forgotten
+        self.commands = SessionStore(ttl=600, max_sessions=256)
+        self.conversations = SessionStore(ttl=600, max_sessions=256)
+        self.commands.start_sweeper()
+        self.conversations.start_sweeper()
         self.status_channel = status_channel
 
     @property
     def public_channels(self):
         """ Dictionary of public channels name to id
         """
-        return {i['name']:i['id'] for i in self.slack_client.api_call("channels.list")['channels']}
+        return self.channels.names('public')
 
     @property
     def private_channels(self):
         """ Dictionary of private channels name to id
         """
-        return {i['name']:i['id'] for i in self.slack_client.api_call("groups.list")['groups']}
+        return self.channels.names('private')
 
     @property
     def dm_channels(self):
         """ Dictionary of direct message channels user id to channel id
         """
-        return {i['user']:i['id'] for i in self.slack_client.api_call("im.list")['ims']}
+        return self.channels.names('dm')
 
     @property
     def call_name(self):
@@ -123,17 +139,23 @@ class Brain(object):
 
         Parameters
         ----------
-        slack_rtm_output : list of dict
+        slack_rtm_output : iterable of dict
             Real time output from Slack client
+        sound_type : {'all', 'dm'}
+            'all' hears every message
+            'dm' hears only the messages that are directed at the bot
 
         Returns
         -------
-        channel : str
-            Channel from which the message arrived
-        message : str
-            Direct message
+        sounds : generator of ear.Sound
+            Channel, user, message, time and whether the bot was mentioned, for each message
         """
-        return ear.listen(self, slack_rtm_output, sound_type=sound_type)
+        def events():
+            for event in slack_rtm_output:
+                if isinstance(event, dict):
+                    self.channels.handle_event(event)
+                yield event
+        return ear.listen(self, events(), sound_type=sound_type)
 
     def speak(self, channel, response, dm=''):
         """ Sends information to Slack client
@@ -193,75 +215,69 @@ class Brain(object):
             False if message is not explicitly directed at bot
         """
         time = float(time)
+        session = self.commands.get(channel, now=time)
         # which messages should i skip?
         if not dm:
             # if not direct message and I'm not conversing with anyone in the given channel
             # skip
-            if channel not in self.commands:
+            if session is None:
                 return
             # if not direct message and I'm not conversing with the person that messaged
             # skip
-            if self.commands[channel][0] not in ['', user]:
+            if session.user not in ['', user]:
                 return
             # NOTE: conversation with user '' means that the conversation is with
             #       everyone in channel
         # if direct message and I'm conversing with someone
-        elif channel in self.commands and abs(time - self.commands[channel][1]) <= 60:
+        elif session is not None and abs(time - session.time) <= 60:
             # if I'm already conversing with someone else, skip
-            if self.commands[channel][0] != user:
+            if session.user != user:
                 self.speak(channel,
                            "I'm sorry, I'm currently talking with <@{0}> at the moment."
-                           "".format(self.commands[channel][0]),
+                           "".format(session.user),
                            dm=user)
                 return
         # if direct message and I'm not conversing with anyone
         else:
             # start new conversation
-            self.commands[channel] = (user, time)
+            session = self.commands.start(channel, user, time)
         # so I'm currently conversing with someone right now
+        # the session expires some time after the last message, not after the last step
+        session.time = time
 
         # end conversation
         enders = ['forget', 'reset', 'fuck', 'shut up', 'stop', 'forget', 'bye']
         for ender in enders:
             if ender in command:
-                del self.commands[channel]
+                self.commands.end(channel)
                 self.speak(channel, 'Alright then.', dm=user)
                 return
         # check
         if 'status' in command:
-            self.speak(channel,
-                       'Bleep bloop\n{0}'.format(' '.join(self.commands[channel][2:])),
-                       dm=user)
+            self.speak(channel, 'Bleep bloop\n{0}'.format(' '.join(session.steps)), dm=user)
             return
         # undo
         if 'undo' in command:
             self.speak(channel, 'Undoing the last input.')
-            self.commands[channel] = self.commands[channel][:-1]
+            session.undo()
             return
 
-        # remember old conversation
-        old_conv = self.commands[channel][2:]
-
         # find actions in command
-        action_name = ''
-        if len(old_conv) >= 1:
-            action_name = old_conv[0]
-        else:
+        action_name = session.action
+        if action_name == '':
             step1 = self._process_step1(command)
             # if nothing found
             if not step1[0]:
                 self.speak(channel, step1[1], dm=user)
                 return
             action_name = step1[1]
-            self.commands[channel] = (user, time, action_name)
+            session.action = action_name
             command = command.split(action_name, 1)[1]
 
         # find option in command
         action = self.actions[action_name]
-        option = ''
-        if len(old_conv) >= 2:
-            option = old_conv[1]
-        else:
+        option = session.option
+        if option == '':
             step2 = self._process_step2(action, command)
             # if nothing found
             if not step2[0]:
@@ -269,27 +285,27 @@ class Brain(object):
                 return
             option = step2[1]
             command = command.split(option, 1)[1]
-            self.commands[channel] = (user, time, action_name, option)
+            session.option = option
 
         # find parameters
         command = command.strip()
-        parameters = old_conv[2:]
+        parameters = list(session.params)
         if len(command) > 2 and command[0] in ["'", '"'] and command[-1] == command[0]:
-            parameters += tuple(shlex.split(command[1:-1]))
+            parameters.extend(shlex.split(command[1:-1]))
         elif command != '':
-            parameters += (command,)
+            parameters.append(command)
 
         # act
         try:
             action.options[option](*parameters)
             self.speak(channel, 'Done!')
-            del self.commands[channel]
+            self.commands.end(channel)
         except BadInput as handler:
             self.speak(channel, handler.message)
-            self.commands[channel] = self.commands[channel][:4] + handler.args
+            session.params = list(handler.args)
         except Messaging as handler:
             self.speak(channel, handler.message)
-            del self.commands[channel]
+            self.commands.end(channel)
 
     def timed_process(self, time):
         """ Runs stored commands every few seconds
@@ -299,16 +315,15 @@ class Brain(object):
         time : int
             Current time
         """
-        for (action, option, inputs, interval), last_time in self.timed_actions.iteritems():
-            if time - last_time > interval:
-                try:
-                    action.options[option](*inputs)
-                    self.timed_actions[(action, option, inputs, interval)] = time
-                except Messaging as handler:
-                    self.speak(self.status_channel, handler.message)
-                except:
-                    self.speak(self.status_channel,
-                               'Something went terribly wrong with {0}'.format(action))
+        for action_name, option, inputs, interval, last_time in self.timed_actions.pop_due(time):
+            action = self.actions[action_name]
+            try:
+                action.options[option](*inputs)
+            except Messaging as handler:
+                self.speak(self.status_channel, handler.message)
+            except:
+                self.speak(self.status_channel,
+                           'Something went terribly wrong with {0}'.format(action))
 
     def initiate_conv(self, channel, label, user, response, kwrds_response, time=0):
         """ Initiates conversation with users
@@ -345,20 +360,22 @@ class Brain(object):
         # store input at each steps
 
         # if no conversation yet or in some while
-        if (channel not in self.conversations or
-                abs(time - self.conversations[channel][1]) > 60):
-            self.conversations[channel] = (time, )
+        conversation = self.conversations.get(channel, now=time)
+        if conversation is None or abs(time - conversation.time) > 60:
+            conversation = self.conversations.start(channel, time=time)
             # self.speak(channel, something)
         # break ice
-        if len(self.conversations[channel]) == 1:
+        if conversation.action == '':
             self.speak(channel, kwrds_response[()])
-            self.conversations[channel] += (label, )
+            conversation.action = label
         # await response
-        elif len(self.conversations[channel]) == 2:
+        elif conversation.user == '':
             for kwrd, backtalk in ((kwrd, val)
-                                   for kwrds, val in kwrds_response.iteritems()
+                                   for kwrds, val in kwrds_response.items()
                                    for kwrd in kwrds):
                 if kwrd in response:
                     self.speak(channel, backtalk)
-                    self.conversations[channel] += (user, response)
+                    conversation.user = user
+                    conversation.time = time
+                    conversation.params.append(response)
                     break
@@ -1,3 +1,52 @@
+""" Ear of the bot
+
+Turns the real time output of the Slack client into one record for each message
+
+"""
+from collections import namedtuple
+import re
+
+Sound = namedtuple('Sound', ['channel', 'user', 'message', 'time', 'dm'])
+Sound.__doc__ = """ Message heard by the bot
+
+Attributes
+----------
+channel : str
+    Channel from which the message arrived
+user : str
+    User from which the message is sent
+message : str
+    Message, without the mentions of the bot
+time : str
+    Time stamp of the message
+dm : bool
+    True if the message mentions the bot
+    False if it does not
+"""
+
+_patterns = {}
+
+
+def mention_pattern(host):
+    """ Compiled pattern that matches every mention of the host
+
+    Parameters
+    ----------
+    host : str
+        Mention of the bot, i.e. <@userid>
+
+    Returns
+    -------
+    pattern : re.Pattern
+        Pattern that matches <@userid> and <@userid|name>
+    """
+    try:
+        return _patterns[host]
+    except KeyError:
+        user_id = host[2:-1] if host.startswith('<@') and host.endswith('>') else host
+        _patterns[host] = re.compile(r'\s*<@{0}(?:\|[^>]*)?>:?\s*'.format(re.escape(user_id)))
+        return _patterns[host]
+
 
 def listen(self, sounds, sound_type='dm'):
     if sound_type == 'dm':
@@ -5,47 +54,57 @@ def listen(self, sounds, sound_type='dm'):
     elif sound_type == 'all':
         return all_messages(self.call_name, sounds)
 
-def direct_messages(host, sounds):
-    """ Extract direct message from input
+
+def hear(host, sounds):
+    """ Generates a record for each message in the input
+
+    Events that are not messages or that are missing information are skipped
 
     Parameters
     ----------
     host : str
         User receiving the message
-    sounds : str
+    sounds : iterable of dict
         Real time messages from Slack client.
         Output of rtm_read() from a Slack client
 
-    Returns
-    -------
-    sound : dict
-        'channel' : str
-            Channel from which the message arrived
-        'user' : str
-            User from which the message is sent
-        'message' : str
-            Direct message
-        {}
-            If the message is not directed at the bot
+    Yields
+    ------
+    sound : Sound
+        Record of the message
     """
-    if not hasattr(sounds, '__iter__'):
-        raise TypeError('Given sounds must be iterable')
-
-    output = {}
+    pattern = mention_pattern(host)
     for sound in sounds:
-        # NOTE: not too sure what multiple sound means
-        if not isinstance(sound, dict):
-            raise TypeError('Each sound must be a dictionary')
         try:
-            # FIXME: assumes that the message always starts with <@userid> if dm
-            #        not so nice if multiple @user are present
-            output['message'] = sound['text'].split(host)[1].strip()
-            output['channel'] = sound['channel']
-            output['user'] = sound['user']
-            output['time'] = sound['ts']
-        except (KeyError, IndexError):
-            pass
-    return output
+            text = sound['text']
+            channel = sound['channel']
+            user = sound['user']
+            time = sound['ts']
+        except (KeyError, TypeError):
+            continue
+        if not isinstance(text, str):
+            continue
+        message, mentions = pattern.subn(' ', text)
+        yield Sound(channel, user, message.strip(), time, mentions > 0)
+
+
+def direct_messages(host, sounds):
+    """ Extract direct messages from input
+
+    Parameters
+    ----------
+    host : str
+        User receiving the message
+    sounds : iterable of dict
+        Real time messages from Slack client.
+        Output of rtm_read() from a Slack client
+
+    Yields
+    ------
+    sound : Sound
+        Record of each message that is directed at the bot
+    """
+    return (sound for sound in hear(host, sounds) if sound.dm)
 
 
 def all_messages(host, sounds):
@@ -55,43 +114,14 @@ def all_messages(host, sounds):
     ----------
     host : str
         User receiving the message
-    sounds : str
+    sounds : iterable of dict
         Real time messages from Slack client.
         Output of rtm_read() from a Slack client
 
-    Returns
-    -------
-    sound : dict
-        'channel' : str
-            Channel from which the message arrived
-        'user' : str
-            User from which the message is sent
-        'message' : str
-            Message
-        'dm' : bool
-            True if direct message
-            False if direct message
-        {}
-            If the message is not directed at the bot
+    Yields
+    ------
+    sound : Sound
+        Record of each message
+        `dm` is True if the message is directed at the bot
     """
-    if not hasattr(sounds, '__iter__'):
-        raise TypeError('Given sounds must be iterable')
-
-    output = {}
-    for sound in sounds:
-        # NOTE: not too sure what multiple sound means
-        if not isinstance(sound, dict):
-            raise TypeError('Each sound must be a dictionary')
-        try:
-            if host in sound['text']:
-                output['message'] = sound['text'].split(host)[1].strip()
-                output['dm'] = True
-            else:
-                output['message'] = sound['text'].strip()
-                output['dm'] = False
-            output['channel'] = sound['channel']
-            output['user'] = sound['user']
-            output['time'] = sound['ts']
-        except (KeyError, IndexError):
-            pass
-    return output
+    return hear(host, sounds)
@@ -3,11 +3,12 @@
 Takes commands from Slack client and translate them into script
 
 """
-import re
 from datetime import datetime, timedelta
 from random import random
 from .action import Action, BadInput, Messaging
 from .utils import nice_options, where_from_identifiers
+import database
+import identity
 
 class GroupMeeting(Action):
     """ Action class for group meeting management
@@ -19,17 +20,9 @@ class GroupMeeting(Action):
         db_conn : sqlite3.Connection
             Database object
         """
+        # NOTE: the group_meetings table is created by migrations.migrate
+        # each call gets a cursor of its own, because the connection depends on the thread
         self.db_conn = db_conn
-        self.cursor = self.db_conn.cursor()
-        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        if u'group_meetings' not in (j for i in self.cursor.fetchall() for j in i):
-            self.cursor.execute('''CREATE TABLE group_meetings
-            (id INTEGER PRIMARY KEY,
-             date TEXT NOT NULL,
-             presenter INTEGER,
-             chair INTEGER,
-             title TEXT)''')
-            self.db_conn.commit()
         # FIXME: there should be a better way for this
         self.col_ids = {'id':0,
                         'date':1,
@@ -81,6 +74,10 @@ class GroupMeeting(Action):
     def select_member_random(self, date_obj, job):
         """ Selects member
 
+        Members that are away on the date are skipped. Each of the other members is weighted by
+        the number of days since they last had the job (none within four weeks), and the member
+        with the largest weighted random number wins.
+
         Parameters
         ----------
         date_obj : datetime.date
@@ -88,62 +85,48 @@ class GroupMeeting(Action):
         job : str
             What role is being selected
             One of ['presenter', 'chair]
+
+        Returns
+        -------
+        member_id : int
+            ID of the selected member
         """
-        # find people that are present
-        people_present = []
-        for row in self.cursor.execute('SELECT id, name, dates_away FROM members'):
-            # translate date
-            dates = re.findall(r'\d\d\d\d-\d\d-\d\d', row[2])[:2]
-            dates = [datetime.strptime(i, '%Y-%m-%d').date() for i in dates]
-            to_dates = dates[0::2]
-            from_dates = dates[0::1]
-            for to_date, from_date in zip(to_dates, from_dates):
-                if to_date < date_obj:
-                    # ASSUME away_dates are in descending order
-                    # there is no need to loop through all dates if a date is
-                    # we find a valid date
-                    people_present.append(row[0])
-                    break
-                elif from_date <= date_obj <= to_date:
-                    # if person is away on that day, break out of loop
-                    break
-            else:
-                # if end of for loop reached
-                people_present.append(row[0])
-
-        # find time since last presentation
-        time_since_last = []
-        for i in people_present:
-            self.cursor.execute('SELECT * FROM group_meetings WHERE {0}=?'
-                                ' ORDER BY date DESC'.format(job), (i,))
-            last_date = self.cursor.fetchone()
-            if last_date in [None, '']:
-                last_date = datetime.min.date()
-            else:
-                last_date = datetime.strptime(last_date[1], '%Y-%m-%d').date()
-            time_since_last.append((date_obj - last_date).days)
-        time_since_last = [i if i>27 else 0 for i in time_since_last]
+        if job not in ['presenter', 'chair']:
+            raise ValueError('Job must be one of "presenter" or "chair"')
+        other = 'chair' if job == 'presenter' else 'presenter'
+        date_str = date_obj.isoformat()
 
         # you can't present and chair at the same time
-        other = ''
-        if job == 'presenter':
-            other = 'chair'
-        elif job == 'chair':
-            other = 'presenter'
-        self.cursor.execute("SELECT {0} FROM group_meetings WHERE date=? "
-                            " AND ({1} is null OR {1}='')".format(other, job),
-                            (date_obj.isoformat(), ))
-        other = self.cursor.fetchone()
-        if other not in ['', None]:
-            time_since_last[people_present.index(other[0])] = 0
-
-        # turn timedelta into weight
-        probs = [weight*random() for weight in time_since_last]
-        # normalize
-        probs = [prob/sum(probs) for prob in probs]
-
-        # winner
-        return people_present[probs.index(max(probs))]
+        cursor = self.db_conn.cursor()
+        cursor.execute("SELECT {0} FROM group_meetings WHERE date=? "
+                       " AND ({1} is null OR {1}='')".format(other, job), (date_str, ))
+        row = cursor.fetchone()
+        taken = row[0] if row is not None else None
+
+        # days since each present member last had the job, in one query
+        cursor.execute('SELECT members.id, julianday(?) - julianday(last.date) FROM members '
+                       'LEFT JOIN (SELECT {0} AS member, MAX(date) AS date '
+                       '           FROM group_meetings GROUP BY {0}) AS last '
+                       'ON last.member = members.id '
+                       'WHERE NOT EXISTS (SELECT 1 FROM away_periods '
+                       '                  WHERE away_periods.member = members.id '
+                       '                  AND start <= ? AND ? <= end)'.format(job),
+                       (date_str, date_str, date_str))
+
+        # turn time since last job into weight and pick the largest weighted random number
+        winner, best = None, 0
+        for member_id, days in cursor:
+            if member_id == taken or (days is not None and days <= 27):
+                continue
+            # never had the job
+            if days is None:
+                days = (date_obj - datetime.min.date()).days
+            prob = days * random()
+            if prob > best:
+                winner, best = member_id, prob
+        if winner is None:
+            raise Messaging('There is no one that can be the {0} on {1}.'.format(job, date_str))
+        return winner
 
     def add(self, date_str='', job='', person=''):
         """ Add a presentation
@@ -164,8 +147,9 @@ class GroupMeeting(Action):
                            ' It must be one of "next" or "yyyy-mm-dd".')
 
         # get the data
-        self.cursor.execute('SELECT * FROM group_meetings ORDER BY date DESC')
-        row = self.cursor.fetchone()
+        cursor = self.db_conn.cursor()
+        cursor.execute('SELECT * FROM group_meetings ORDER BY date DESC')
+        row = cursor.fetchone()
 
         # find the date
         date_obj = None
@@ -196,10 +180,7 @@ class GroupMeeting(Action):
 
         if person == 'random':
             person = self.select_member_random(date_obj, job)
-        self.cursor.execute('SELECT id FROM members WHERE id=?'
-                            ' or name=? or userid=? or slack_id=?',
-                            (person, )*4)
-        matches = self.cursor.fetchall()
+        matches = identity.index(self.db_conn).find(person)
         if len(matches) == 0:
             raise BadInput('I could not find anyone whose id, name,'
                            ' userid, or slackid is {0}.\n'
@@ -211,52 +192,118 @@ class GroupMeeting(Action):
                            'Would you care to try again?'.format(person),
                            args=(date_str, job,))
         else:
-            person = matches[0][0]
+            person = matches[0]['id']
 
         # Add data
-        self.cursor.execute('SELECT * FROM group_meetings WHERE date=?',
-                            (date_obj.isoformat(), ))
-        rows = self.cursor.fetchall()
-        if len(rows) == 0:
-            self.cursor.execute('INSERT INTO group_meetings (date, {0})'
-                                ' VALUES (?,?)'.format(job),
-                                (date_obj.isoformat(), person))
-        elif len(rows) == 1:
-            if rows[0][self.col_ids[job]] in [None, '']:
-                self.cursor.execute('UPDATE group_meetings SET {0}=? WHERE id=?'.format(job),
-                                    (person, rows[0][self.col_ids['id']]))
+        with database.transaction(self.db_conn):
+            cursor.execute('SELECT * FROM group_meetings WHERE date=?',
+                           (date_obj.isoformat(), ))
+            rows = cursor.fetchall()
+            if len(rows) == 0:
+                cursor.execute('INSERT INTO group_meetings (date, {0})'
+                               ' VALUES (?,?)'.format(job),
+                               (date_obj.isoformat(), person))
+            elif len(rows) == 1:
+                if rows[0][self.col_ids[job]] in [None, '']:
+                    cursor.execute('UPDATE group_meetings SET {0}=? WHERE id=?'.format(job),
+                                   (person, rows[0][self.col_ids['id']]))
+                else:
+                    # FIXME
+                    raise Messaging('There already is a person assigned.')
             else:
                 # FIXME
-                raise Messaging('There already is a person assigned.')
-        else:
-            # FIXME
-            raise Messaging('There are more than one meetings to assign to.'
-                            " I don't know what to do.")
-        self.db_conn.commit()
+                raise Messaging('There are more than one meetings to assign to.'
+                                " I don't know what to do.")
 
         #FIXME: PLOP PLOP
         if is_fucking_hassel:
             self.add(date_str, 'chair', 'random')
 
-    def list(self):
-        """ Shows all presentations that satifies some conditions
+    def format_meetings(self, rows):
+        """ Formats group meetings into a table
 
         Parameters
         ----------
+        rows : iterable of tuple
+            ID, date, presenter name, chair name and title of each meeting
+
+        Returns
+        -------
+        message : str
+            One line for the header and one line for each meeting
         """
-        #FIXME: identifier?
-        self.cursor.execute('SELECT * FROM group_meetings ORDER BY date DESC')
-        rows = self.cursor.fetchall()
-        message = '{0:<4}{1:<10}{2:<20}{3:<20}{4:<40}\n'.format('id', 'date', 'presenter', 'chair', 'title')
+        line = '{0:<6}{1:<12}{2:<20}{3:<20}{4:<40}'
+        lines = [line.format('id', 'date', 'presenter', 'chair', 'title').rstrip()]
         for row in rows:
-            data_id = row[0]
-            date = row[1]
-            self.cursor.execute('SELECT name FROM members WHERE id=?', (row[2],))
-            presenter = str(self.cursor.fetchone())
-            self.cursor.execute('SELECT name FROM members WHERE id=?', (row[3],))
-            chair = str(self.cursor.fetchone())
-            title = row[4]
-            message += '{0:<4}{1:<10}{2:<20}{3:<20}{4:<40}\n'.format(data_id, date, presenter, chair, title)
+            lines.append(line.format(*('' if i is None else i for i in row)).rstrip())
+        return '\n'.join(lines)
+
+    def list(self, *options):
+        """ Shows all presentations that satifies some conditions
+
+        Parameters
+        ----------
+        options : list of str
+            Any of the following, in any order:
+                `upcoming`
+                    Only the meetings from today onwards, earliest first
+                `last`
+                    Only the meetings before today, latest first
+                `from yyyy-mm-dd`, `to yyyy-mm-dd`
+                    Only the meetings within the given dates
+                a number
+                    Number of meetings in each page (default is 20)
+                `page <number>`
+                    Page of the listing (default is 1)
+        """
+        usage = ('To list the group meetings, you can give `upcoming`, `last`, `from yyyy-mm-dd`,'
+                 ' `to yyyy-mm-dd`, the number of meetings per page, or `page <number>`.')
+        today = datetime.today().date().isoformat()
+        conditions = []
+        vals = []
+        order = 'DESC'
+        page_size = 20
+        page = 1
+        options = iter(options)
+        for option in options:
+            if option == 'upcoming':
+                conditions.append('group_meetings.date >= ?')
+                vals.append(today)
+                order = 'ASC'
+            elif option == 'last':
+                conditions.append('group_meetings.date < ?')
+                vals.append(today)
+            elif option in ['from', 'to', 'page']:
+                value = next(options, '')
+                if option == 'page' and value.isdigit() and int(value) > 0:
+                    page = int(value)
+                elif option != 'page' and self.is_valid_date(value) and value != 'next':
+                    conditions.append('group_meetings.date {0} ?'.format('>=' if option == 'from'
+                                                                         else '<='))
+                    vals.append(value)
+                else:
+                    raise Messaging(usage)
+            elif option.isdigit() and int(option) > 0:
+                page_size = min(int(option), 200)
+            else:
+                raise Messaging(usage)
+
+        where_command = 'WHERE {0}'.format(' AND '.join(conditions)) if conditions else ''
+        cursor = self.db_conn.cursor()
+        cursor.execute('SELECT group_meetings.id, group_meetings.date, presenters.name, '
+                       'chairs.name, group_meetings.title FROM group_meetings '
+                       'LEFT JOIN members AS presenters '
+                       'ON presenters.id = group_meetings.presenter '
+                       'LEFT JOIN members AS chairs ON chairs.id = group_meetings.chair '
+                       '{0} ORDER BY group_meetings.date {1}, group_meetings.id {1} '
+                       'LIMIT ? OFFSET ?'.format(where_command, order),
+                       vals + [page_size + 1, (page - 1) * page_size])
+        rows = cursor.fetchall()
+        if not rows:
+            raise Messaging('There are no group meetings to show.')
+        message = self.format_meetings(rows[:page_size])
+        if len(rows) > page_size:
+            message += '\nFor more, add `page {0}`.'.format(page + 1)
         raise Messaging(message)
 
     def modify(self, item='', to_val='', *identifiers):
@@ -295,8 +342,9 @@ class GroupMeeting(Action):
                            args=(item, to_val) + tuple(identifiers))
 
         where_command, vals = where_from_identifiers(*identifiers)
-        self.cursor.execute('SELECT * FROM members {0} '.format(where_command), vals)
-        rows = self.cursor.fetchall()
+        cursor = self.db_conn.cursor()
+        cursor.execute('SELECT * FROM members {0} '.format(where_command), vals)
+        rows = cursor.fetchall()
         if len(rows) == 0:
             messages = ['{0} is {1}'.format(i, j) for i, j in zip(identifiers, identifiers[1:])]
             raise Messaging('I could not find any presentation where {0}'
@@ -310,6 +358,10 @@ class GroupMeeting(Action):
                                      nice_options(self.col_ids.keys())),
                            args=(item, to_val) + tuple(identifiers))
         else:
-            self.cursor.execute('UPDATE members SET {0}=? WHERE id=?'.format(item),
-                                (to_val, rows[0][0]))
-            self.db_conn.commit()
+            with database.transaction(self.db_conn):
+                cursor.execute('UPDATE members SET {0}=? WHERE id=?'.format(item),
+                               (to_val, rows[0][0]))
+            if item == 'id':
+                identity.index(self.db_conn).refresh(rows[0][0], to_val)
+            else:
+                identity.index(self.db_conn).refresh(rows[0][0])
@@ -48,9 +48,9 @@ class InteractiveAction(Action):
         True if channel is valid
         False if channel is not valid
         """
-        return channel in (self.actor.public_channels.keys() +
-                           self.actor.private_channels.keys() +
-                           self.actor.dm_channels.keys())
+        return (channel in self.actor.public_channels or
+                channel in self.actor.private_channels or
+                channel in self.actor.dm_channels)
 
     def ask(self, channels='', ice_breaker='', kwrds_response='', action='', option='', inputs=''):
         """ Asks users for input (after telling it what to ask) and executes
@@ -157,8 +157,8 @@ class InteractiveAction(Action):
         for channel in channels:
             self.actor.speak(channel, ice_breaker)
             # NOTE: kills all conversations that were already happening in these channels
-            if channel in self.actor.commmands:
-                self.actor.conversations[channel] = ('', time.time(), 'conversation', 'converse')
+            if channel in self.actor.commands:
+                self.actor.conversations.start(channel, '', time.time(), 'conversation', 'converse')
         # process user response
         self.actor.process()
 
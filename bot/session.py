@@ -0,0 +1,236 @@
+""" Module for keeping track of the conversations of the bot
+
+Each channel has at most one session, which remembers who the bot is talking with and the inputs
+that have been given so far. Sessions expire after some time without a message, and the least
+recently used sessions are dropped when there are too many, so that abandoned conversations do not
+pile up.
+
+"""
+from collections import OrderedDict
+import threading
+import time as clock
+
+
+class Session(object):
+    """ Conversation of the bot in a channel
+
+    Attributes
+    ----------
+    user : str
+        Who the bot is talking with
+        '' if the bot is talking with everyone in the channel
+    time : float
+        Time of the last message of the conversation
+    action : str
+        Name of the action (or label of the conversation)
+        '' if not given yet
+    option : str
+        Option of the action
+        '' if not given yet
+    params : list
+        Inputs given to the option so far
+    """
+    __slots__ = ('user', 'time', 'action', 'option', 'params')
+
+    def __init__(self, user='', time=0.0, action='', option='', params=()):
+        self.user = user
+        self.time = time
+        self.action = action
+        self.option = option
+        self.params = list(params)
+
+    def __repr__(self):
+        return 'Session({0!r}, {1!r}, {2!r}, {3!r}, {4!r})'.format(self.user, self.time,
+                                                                  self.action, self.option,
+                                                                  self.params)
+
+    @property
+    def steps(self):
+        """ Inputs given so far, starting from the action
+
+        Returns
+        -------
+        steps : list of str
+            Action, option and parameters that have been given
+        """
+        return [i for i in (self.action, self.option) if i != ''] + self.params
+
+    def undo(self):
+        """ Forgets the last input
+        """
+        if self.params:
+            self.params.pop()
+        elif self.option != '':
+            self.option = ''
+        else:
+            self.action = ''
+
+
+class SessionStore(object):
+    """ Sessions of the bot, one for each channel
+
+    Attributes
+    ----------
+    ttl : float
+        Number of seconds without a message after which a session expires
+    max_sessions : int
+        Largest number of sessions that are kept
+        The least recently used session is dropped to make room for a new one
+    """
+    def __init__(self, ttl=600, max_sessions=256):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.expired = 0
+        self.evicted = 0
+
+    def __contains__(self, channel):
+        # unlike get, a membership test neither expires nor reorders the sessions
+        session = self._sessions.get(channel)
+        return session is not None and clock.time() - session.time <= self.ttl
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, channel, now=None):
+        """ Returns the session of the channel
+
+        Parameters
+        ----------
+        channel : str
+            Channel of the session
+        now : float
+            Current time
+            Default is the time of the call
+
+        Returns
+        -------
+        session : Session
+            Session of the channel
+            None if there is no session or if it has expired
+        """
+        now = clock.time() if now is None else now
+        with self._lock:
+            session = self._sessions.get(channel)
+            if session is None:
+                return None
+            if now - session.time > self.ttl:
+                del self._sessions[channel]
+                self.expired += 1
+                return None
+            self._sessions.move_to_end(channel)
+            return session
+
+    def start(self, channel, user='', time=None, action='', option='', params=()):
+        """ Starts a new session in the channel, replacing the old one
+
+        Parameters
+        ----------
+        channel : str
+            Channel of the session
+        user : str
+            Who the bot is talking with
+        time : float
+            Time of the message that started the session
+            Default is the time of the call
+        action : str
+            Name of the action
+        option : str
+            Option of the action
+        params : tuple
+            Inputs given to the option
+
+        Returns
+        -------
+        session : Session
+            New session
+        """
+        session = Session(user, clock.time() if time is None else time, action, option, params)
+        with self._lock:
+            self._sessions[channel] = session
+            self._sessions.move_to_end(channel)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        return session
+
+    def end(self, channel):
+        """ Ends the session of the channel
+
+        Parameters
+        ----------
+        channel : str
+            Channel of the session
+        """
+        with self._lock:
+            self._sessions.pop(channel, None)
+
+    def sweep(self, now=None):
+        """ Removes the sessions that have expired
+
+        Parameters
+        ----------
+        now : float
+            Current time
+            Default is the time of the call
+
+        Returns
+        -------
+        count : int
+            Number of sessions that were removed
+        """
+        now = clock.time() if now is None else now
+        with self._lock:
+            expired = [channel for channel, session in self._sessions.items()
+                       if now - session.time > self.ttl]
+            for channel in expired:
+                del self._sessions[channel]
+            self.expired += len(expired)
+        return len(expired)
+
+    def start_sweeper(self, interval=60):
+        """ Sweeps the expired sessions every so often from a background thread
+
+        Parameters
+        ----------
+        interval : float
+            Number of seconds between the sweeps
+        """
+        if self._sweeper is not None:
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.sweep()
+
+        self._sweeper = stop
+        threading.Thread(target=run, name='session-sweeper', daemon=True).start()
+
+    def stop_sweeper(self):
+        """ Stops the background sweeps
+        """
+        if self._sweeper is not None:
+            self._sweeper.set()
+            self._sweeper = None
+
+    def stats(self):
+        """ Returns the number of sessions
+
+        Returns
+        -------
+        stats : dict
+            'active' : int
+                Number of sessions that have not expired
+            'expired' : int
+                Number of sessions that expired
+            'evicted' : int
+                Number of sessions that were dropped to make room for newer ones
+        """
+        self.sweep()
+        with self._lock:
+            return {'active': len(self._sessions),
+                    'expired': self.expired,
+                    'evicted': self.evicted}
@@ -1,10 +1,143 @@
 """ Module for implementing functionality periodically within some time period
 
 """
+import heapq
+import json
 import time
+import database
 from .action import Action, BadInput, Messaging
 from .utils import nice_options
 
+
+class TimedActionStore(object):
+    """ Timed actions stored in the database and queued by the time they are next due
+
+    Attributes
+    ----------
+    db_conn : database.Database
+        Database object
+    entries : dict
+        Dictionary of database id to (action name, option, inputs, interval, last time)
+    heap : list
+        Heap of (next time due, database id)
+    """
+    def __init__(self, db_conn):
+        self.db_conn = db_conn
+        self.entries = {}
+        self.heap = []
+        self.load()
+
+    def load(self):
+        """ Loads the timed actions from the database
+        """
+        self.entries = {}
+        self.heap = []
+        cursor = self.db_conn.cursor()
+        cursor.execute('SELECT id, action, option, inputs, interval, last_time'
+                       ' FROM timed_actions')
+        for row_id, action, option, inputs, interval, last_time in cursor.fetchall():
+            # never run
+            if last_time is None:
+                last_time = 0.0
+            self.entries[row_id] = (action, option, tuple(json.loads(inputs)), interval, last_time)
+            self.heap.append((last_time + interval, row_id))
+        heapq.heapify(self.heap)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, action, option, inputs, interval, last_time):
+        """ Stores a new timed action
+
+        Parameters
+        ----------
+        action : str
+            Name of the action
+        option : str
+            Option of the action
+        inputs : tuple of str
+            Inputs of the option
+        interval : int
+            Number of seconds between each run
+        last_time : float
+            Time at which the action was last run
+        """
+        with database.transaction(self.db_conn) as db_conn:
+            cursor = db_conn.execute('INSERT INTO timed_actions (action, option, inputs, interval,'
+                                     ' last_time) VALUES (?,?,?,?,?)',
+                                     (action, option, json.dumps(list(inputs)), interval,
+                                      last_time))
+        self.entries[cursor.lastrowid] = (action, option, tuple(inputs), interval, last_time)
+        heapq.heappush(self.heap, (last_time + interval, cursor.lastrowid))
+
+    def remove(self, row_id):
+        """ Removes a timed action
+
+        Parameters
+        ----------
+        row_id : int
+            Database id of the timed action
+
+        Notes
+        -----
+        The action stays in the heap until it is due, where it is skipped by `pop_due`.
+        """
+        with database.transaction(self.db_conn) as db_conn:
+            db_conn.execute('DELETE FROM timed_actions WHERE id=?', (row_id, ))
+        self.entries.pop(row_id, None)
+
+    def find(self, action, option, inputs):
+        """ Returns the database ids of the timed actions that run the given command
+
+        Parameters
+        ----------
+        action : str
+            Name of the action
+        option : str
+            Option of the action
+        inputs : tuple of str
+            Inputs of the option
+
+        Returns
+        -------
+        row_ids : list of int
+            Database ids of the matching timed actions
+        """
+        return [row_id for row_id, entry in self.entries.items()
+                if entry[:3] == (action, option, tuple(inputs))]
+
+    def pop_due(self, time):
+        """ Returns the timed actions that are due and queues their next run
+
+        Parameters
+        ----------
+        time : float
+            Current time
+
+        Returns
+        -------
+        due : list of tuple
+            List of (action name, option, inputs, interval, last time) that are due
+        """
+        due = []
+        while self.heap and self.heap[0][0] < time:
+            _, row_id = heapq.heappop(self.heap)
+            if row_id not in self.entries:
+                continue
+            action, option, inputs, interval, _ = self.entries[row_id]
+            self.entries[row_id] = (action, option, inputs, interval, time)
+            heapq.heappush(self.heap, (time + interval, row_id))
+            due.append(row_id)
+        if due:
+            with database.transaction(self.db_conn) as db_conn:
+                db_conn.executemany('UPDATE timed_actions SET last_time=? WHERE id=?',
+                                    [(time, row_id) for row_id in due])
+        return [self.entries[row_id] for row_id in due]
+
+
 class TimedAction(Action):
     """ Action class for repeating actions
     """
@@ -38,10 +171,10 @@ class TimedAction(Action):
 
         """
         msg = 'Here are the registered timed actions:\n'
-        for (action, option, inputs, interval), last_time in self.actor.timed_actions.iteritems():
+        for action, option, inputs, interval, last_time in self.actor.timed_actions:
             msg += ('Command: {0} {1} {2}\n'
                     'Time Interval: {3}\n'
-                    'Last Time: {4}\n\n'.format(action.name, option, inputs, interval, last_time))
+                    'Last Time: {4}\n\n'.format(action, option, inputs, interval, last_time))
         # I'm being lazy here. Because I need the channel to speak, but I think
         # channel should be independent of the action
         raise Messaging(msg)
@@ -80,11 +213,11 @@ class TimedAction(Action):
         inputs = tuple(commands)
         try:
             action.options[option](*inputs)
-            self.actor.timed_actions[(action.name, option, inputs, interval)] = time.time()
+            self.actor.timed_actions.add(action.name, option, inputs, interval, time.time())
         except BadInput as handler:
             raise BadInput(handler.message, args=(str(interval), action.name, option) + handler.args)
         except Messaging as handler:
-            self.actor.timed_actions[(action, option, inputs, interval)] = time.time()
+            self.actor.timed_actions.add(action.name, option, inputs, interval, time.time())
             raise handler
 
     def remove(self, action='', *commands):
@@ -107,4 +240,14 @@ class TimedAction(Action):
         if error_msg != '':
             raise BadInput(error_msg)
 
+        option, inputs = commands[0], tuple(commands[1:])
+        row_ids = self.actor.timed_actions.find(action, option, inputs)
+        if not row_ids:
+            raise Messaging('I could not find the timed action, `{0} {1}`. See `@ayerslab_bot '
+                            'timing actions recount` for a list of commands'
+                            ''.format(action, ' '.join(commands)))
+        for row_id in row_ids:
+            self.actor.timed_actions.remove(row_id)
+        raise Messaging('I will no longer repeat `{0} {1}`.'.format(action, ' '.join(commands)))
+
     #TODO: modify
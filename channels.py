@@ -0,0 +1,178 @@
+"""Module for looking up Slack channels without listing them on every lookup.
+
+The lists of public channels, private channels and direct message channels are cached for a while
+and are updated from the RTM events that create, rename or remove channels.
+
+"""
+import threading
+import time
+
+# kind of channel to the Web API method that lists them, the key of the list in the response, and
+# the key of each channel that is used as its name
+SOURCES = {'public': ('channels.list', 'channels', 'name'),
+           'private': ('groups.list', 'groups', 'name'),
+           'dm': ('im.list', 'ims', 'user')}
+
+# RTM event type to the kind of channel that it changes
+EVENTS = {'channel_created': 'public',
+          'channel_rename': 'public',
+          'channel_deleted': 'public',
+          'channel_archive': 'public',
+          'channel_unarchive': 'public',
+          'group_joined': 'private',
+          'group_rename': 'private',
+          'group_left': 'private',
+          'group_archive': 'private',
+          'group_unarchive': 'private',
+          'im_created': 'dm',
+          'im_close': 'dm'}
+
+
+class ChannelDirectory(object):
+    """Cache of the channels of the Slack workspace.
+
+    Attributes
+    ----------
+    client : SlackClient
+        Slack client used to list the channels.
+    ttl : float
+        Number of seconds after which the list of a kind of channel is fetched again.
+    miss_ttl : float
+        Number of seconds after which a lookup of an unknown channel fetches the list again.
+
+    """
+    def __init__(self, client, ttl=600, miss_ttl=30):
+        self.client = client
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        # kind to (time fetched, name to id, id to name)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, kind):
+        """Fetch the channels of the given kind from Slack."""
+        method, key, name_key = SOURCES[kind]
+        names = {i[name_key]: i['id'] for i in self.client.api_call(method).get(key, [])}
+        ids = {j: i for i, j in names.items()}
+        with self._lock:
+            self._cache[kind] = (time.monotonic(), names, ids)
+        return names, ids
+
+    def _get(self, kind, max_age=None):
+        """Return the name to id and id to name dictionaries of the given kind of channel."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            cached = self._cache.get(kind)
+        if cached is None or time.monotonic() - cached[0] > max_age:
+            return self._fetch(kind)
+        return cached[1:]
+
+    def names(self, kind):
+        """Return the dictionary of names to ids of the given kind of channel.
+
+        Parameters
+        ----------
+        kind : {'public', 'private', 'dm'}
+            Kind of channel.
+            Direct message channels are named by the id of the user.
+
+        Returns
+        -------
+        names : dict of str to str
+            Name of each channel to its id.
+
+        """
+        return self._get(kind)[0]
+
+    def id(self, name, kinds=('public', 'private')):
+        """Return the id of the channel with the given name.
+
+        Parameters
+        ----------
+        name : str
+            Name of the channel.
+        kinds : tuple of str
+            Kinds of channel that are searched.
+
+        Returns
+        -------
+        channel_id : str
+            ID of the channel.
+            None if the channel cannot be found.
+
+        """
+        for max_age in [None, self.miss_ttl]:
+            for kind in kinds:
+                channel_id = self._get(kind, max_age)[0].get(name)
+                if channel_id is not None:
+                    return channel_id
+        return None
+
+    def name(self, channel_id, kinds=('public', 'private')):
+        """Return the name of the channel with the given id.
+
+        Parameters
+        ----------
+        channel_id : str
+            ID of the channel.
+        kinds : tuple of str
+            Kinds of channel that are searched.
+
+        Returns
+        -------
+        name : str
+            Name of the channel.
+            None if the channel cannot be found.
+
+        """
+        for max_age in [None, self.miss_ttl]:
+            for kind in kinds:
+                name = self._get(kind, max_age)[1].get(channel_id)
+                if name is not None:
+                    return name
+        return None
+
+    def invalidate(self, kind=None):
+        """Forget the cached channels so that they are fetched on the next lookup.
+
+        Parameters
+        ----------
+        kind : {'public', 'private', 'dm', None}
+            Kind of channel to forget.
+            Default forgets all channels.
+
+        """
+        with self._lock:
+            if kind is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(kind, None)
+
+    def handle_event(self, event):
+        """Update the cache from an RTM event.
+
+        New and renamed channels are added to the cache, and other changes to the channels
+        invalidate the cache of that kind of channel.
+
+        Parameters
+        ----------
+        event : dict
+            Event from the RTM API.
+
+        """
+        kind = EVENTS.get(event.get('type'))
+        if kind is None:
+            return
+        channel = event.get('channel')
+        if event['type'] in ['channel_created', 'channel_rename', 'group_rename']:
+            with self._lock:
+                cached = self._cache.get(kind)
+                if cached is not None and isinstance(channel, dict):
+                    # copy so that the dictionaries given out are not changed
+                    fetched, names, ids = cached[0], dict(cached[1]), dict(cached[2])
+                    names.pop(ids.get(channel['id']), None)
+                    names[channel['name']] = channel['id']
+                    ids[channel['id']] = channel['name']
+                    self._cache[kind] = (fetched, names, ids)
+                    return
+        self.invalidate(kind)
@@ -0,0 +1,105 @@
+"""Module for the commands that the bot understands.
+
+The commands are declared once and compiled into an immutable trie (see `action.compile_actions`).
+Values that change from message to message are declared with `action.Context` and are bound when
+the command is called.
+
+"""
+from action import Context, compile_actions
+import debug
+import door
+import members
+import quiet
+import file_print
+import money
+
+SLACK_CLIENT = Context('slack_client')
+DB_CONN = Context('db_conn')
+USER = Context('readable_user')
+MSG = Context('msg')
+SHUSH_CHANNEL = Context('shush_channel')
+
+declared = {
+    'door': {
+        'open': ['', door.open_door, DB_CONN, USER, MSG],
+        '@': ['', door.open_door, DB_CONN, USER, MSG],
+        '#': ['', door.open_door, DB_CONN, USER, MSG],
+        'i': ['', door.open_door, DB_CONN, USER, MSG],
+        'abre': ['', door.open_door, DB_CONN, USER, MSG],
+        'ouvre': ['', door.open_door, DB_CONN, USER, MSG],
+        u'\u5f00\u95e8': ['', door.open_door, DB_CONN, USER, MSG],
+        'add': ['To add a user to access the door, you must provide an '
+                'identification of the user, like their name or Slack id.',
+                door.add, DB_CONN, USER],
+    },
+    'members': {
+        'add': ['To add a member to the Ayer\'s lab group member database, you must'
+                ' provide the name, userid, slack id, email, position of the '
+                'new member, permission to the bot, and permission to the door in '
+                'the given order. The entries are space delimited, which means that'
+                ' you must encase multiword entries within quotes. '
+                'If you are missing any of these information, just leave the '
+                'information blank, i.e. \'\'.',
+                members.add, DB_CONN, USER],
+        'modify': ["To modify a member's information in the database, you must "
+                   "provide the column that you'd like to modify, the new value, "
+                   "and identifiers of the members (alternating between the column "
+                   "and its value).",
+                   members.modify, DB_CONN, USER],
+        'list': ["To list the members' information in the database, you must "
+                 "provide the columns that you'd like to see.",
+                 members.list, DB_CONN],
+        'import_from_slack': ['', members.import_from_slack, SLACK_CLIENT, DB_CONN],
+    },
+    'quiet': ['', quiet.shush, SLACK_CLIENT, DB_CONN, USER, SHUSH_CHANNEL],
+    'upload': ['', file_print.upload, DB_CONN, MSG],
+    'print': {
+        'status': ['', file_print.status, DB_CONN, USER],
+        'cancel': ['To cancel a print job, you need to provide the job number.',
+                   file_print.cancel, DB_CONN, USER],
+        # anything else is the name of the file
+        None: ["To print a file, you must provide the filename of the file that "
+               "you've uploaded. Then, you can provided print options in the "
+               "following order: number of sides, which must be one of `single` or "
+               "`double` (default is `double`); color, which must be one of `color` "
+               "or `black` (default is `black`); quality, which must be one of "
+               "`high` or `economy` (default is `economy`); and page numbers, which "
+               "uses dashes to include multiple pages in an interval and commas to "
+               "include separated pages (default is all pages). Since keyword "
+               "arguments are not supported you must supply all arguments up until "
+               "desired arugment to modify. For example, to specify print quality, "
+               "you must provide the number of sides and color.",
+               file_print.file_print, DB_CONN, USER],
+    },
+    'money': {
+        'remind': ['To remind people about money related things, you need to '
+                   'provide their user names (space separated). If you want to find'
+                   ' everyone related to you, write `everyone` instead.',
+                   money.remind, SLACK_CLIENT, DB_CONN, USER],
+        'remove': ['To remove a receipt, you need to provide the receipt ID.',
+                   money.remove_receipt, DB_CONN, USER],
+        'add': ["To add a receipt, you need to provide the lender, the borrower, "
+                "the amount, and the description of the transaction, in the given "
+                "order.",
+                money.add_receipt, DB_CONN],
+        'list': ['', money.list, DB_CONN, USER],
+        'settle': ['To settle the receipts that have not been paid with as few transfers as '
+                   'possible, write `money settle`. To also message everyone their transfers, '
+                   'write `money settle notify`.',
+                   money.settle, SLACK_CLIENT, DB_CONN, USER],
+        'confirm': ['To confirm a transaction, you need to provide the ID of the '
+                    'receipt and the type of confirmation (one of `receipt` or '
+                    '`payment`).', money.confirm, DB_CONN, USER],
+    },
+    'debug': {
+        'stats': ['To show how long each stage of each command has taken, write `debug stats`. To '
+                  'also forget the timings, write `debug stats reset`.',
+                  debug.stats, DB_CONN, USER],
+    },
+    # 'meetings': {
+    # },
+    # 'random': {
+    # },
+}
+
+actions = compile_actions(declared)
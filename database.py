@@ -0,0 +1,196 @@
+"""Module for connecting to ayerslab.db from many threads.
+
+Commands, scheduled jobs and background writers run in different threads. Instead of sharing one
+connection between them, each thread is given its own connection to the database, which is in
+write-ahead logging (WAL) mode so that reads do not wait for writes. Writers wait for each other
+with a busy timeout instead of failing with `database is locked`, and the writes of the commands,
+which go through `transaction`, are serialized within the process. If `timings` is enabled, the time
+spent running and fetching statements is accumulated as the `sql` stage of the running command.
+
+"""
+from contextlib import contextmanager
+import sqlite3
+import threading
+import time
+import timings
+
+
+def _timed(method):
+    """Return the method of the cursor, accumulating its duration as the `sql` stage if timed."""
+    def timed(self, *args, **kwargs):
+        if not timings.enabled:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            timings.accumulate('sql', time.perf_counter() - start)
+    timed.__name__ = method.__name__
+    timed.__doc__ = method.__doc__
+    return timed
+
+
+class Cursor(sqlite3.Cursor):
+    """Cursor that times its statements."""
+    execute = _timed(sqlite3.Cursor.execute)
+    executemany = _timed(sqlite3.Cursor.executemany)
+    fetchone = _timed(sqlite3.Cursor.fetchone)
+    fetchmany = _timed(sqlite3.Cursor.fetchmany)
+    fetchall = _timed(sqlite3.Cursor.fetchall)
+    __next__ = _timed(sqlite3.Cursor.__next__)
+
+
+class Connection(sqlite3.Connection):
+    """Connection that knows the `Database` that it belongs to.
+
+    Statements are run by `Cursor`, so that they are timed.
+
+    Attributes
+    ----------
+    database : Database
+        Manager that opened the connection.
+
+    """
+    database = None
+
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+def database_path(db_conn):
+    """Return the path to the file of the main database of the connection."""
+    return db_conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+class Database(object):
+    """Per-thread connections to a SQLite database.
+
+    Attributes of the connection of the calling thread can be used directly on the manager, e.g.
+    `db.cursor()` or `db.commit()`, so that the manager can be given wherever a connection is
+    expected.
+
+    Attributes
+    ----------
+    path : str
+        Path to the database file.
+    timeout : float
+        Number of seconds that a connection waits for another to finish writing.
+
+    """
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._trace = None
+
+    def __getattr__(self, name):
+        return getattr(self.connection(), name)
+
+    def connection(self):
+        """Return the connection of the calling thread, opening it if needed.
+
+        Returns
+        -------
+        db_conn : Connection
+            Connection that is only used by the calling thread.
+
+        """
+        db_conn = getattr(self._local, 'db_conn', None)
+        if db_conn is None:
+            # only the owning thread uses the connection, but any thread may close it
+            db_conn = sqlite3.connect(self.path, timeout=self.timeout, factory=Connection,
+                                      check_same_thread=False)
+            db_conn.database = self
+            db_conn.execute('PRAGMA journal_mode=WAL')
+            db_conn.execute('PRAGMA synchronous=NORMAL')
+            db_conn.execute('PRAGMA busy_timeout={0}'.format(int(self.timeout * 1000)))
+            db_conn.set_trace_callback(self._trace)
+            self._local.db_conn = db_conn
+            with self._lock:
+                self._connections.append(db_conn)
+        return db_conn
+
+    def set_trace_callback(self, callback):
+        """Call the given function with each statement that is run by any thread.
+
+        Parameters
+        ----------
+        callback : function
+            Function of the statement. None to stop tracing.
+
+        """
+        with self._lock:
+            self._trace = callback
+            for db_conn in self._connections:
+                db_conn.set_trace_callback(callback)
+
+    @contextmanager
+    def write(self):
+        """Run the enclosed statements as one write transaction.
+
+        The transaction takes the write lock of the database when it begins, and the writes of the
+        process go through one at a time. The transaction is committed at the end of the block, or
+        rolled back if the block raises.
+
+        Yields
+        ------
+        db_conn : Connection
+            Connection of the calling thread.
+
+        """
+        db_conn = self.connection()
+        with self._write_lock:
+            if db_conn.in_transaction:
+                db_conn.commit()
+            db_conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield db_conn
+            except BaseException:
+                db_conn.rollback()
+                raise
+            db_conn.commit()
+
+    def close(self):
+        """Close the connections of all threads."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for db_conn in connections:
+            db_conn.close()
+        self._local = threading.local()
+
+
+@contextmanager
+def transaction(db_conn):
+    """Run the enclosed statements as one write transaction on the given connection.
+
+    Writes to a `Database`, or to one of its connections, go through `Database.write`, so that they
+    are serialized with the other writes of the process. Other connections commit at the end of the
+    block, or roll back if the block raises.
+
+    Parameters
+    ----------
+    db_conn : Database or sqlite3.Connection
+        Database connection object.
+
+    Yields
+    ------
+    db_conn : sqlite3.Connection
+        Connection on which the statements are run.
+
+    """
+    database = db_conn if isinstance(db_conn, Database) else getattr(db_conn, 'database', None)
+    if database is None:
+        with db_conn:
+            yield db_conn
+    else:
+        with database.write() as write_conn:
+            yield write_conn
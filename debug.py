@@ -0,0 +1,28 @@
+"""Module for commands that help debug the bot."""
+from action import ActionInputError
+import members
+import timings
+
+
+def stats(db_conn, user, option=''):
+    """Show how long each stage of each command has taken.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+    user : str
+        User that is asking for the timings.
+    option : str
+        `reset` to forget the timings after showing them.
+
+    """
+    if not members.has_permission(db_conn.cursor(), user):
+        raise ActionInputError('You do not have the permission.')
+    if option not in ['', 'reset']:
+        raise ActionInputError('To forget the timings after showing them, write '
+                               '`debug stats reset`.')
+    message = timings.summary()
+    if option == 'reset':
+        timings.reset()
+    raise ActionInputError(message)
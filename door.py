@@ -1,27 +1,159 @@
-import RPi.GPIO as GPIO
-from threading import Timer
-import datetime
+"""Module for opening the door of the lab.
+
+The relay of the door lock is driven by one long-lived thread that takes requests from a queue, so
+that the GPIO pins are set up once and requests that overlap extend the current pulse instead of
+starting timers that turn the relay off in the middle of another opening.
+
+"""
+import collections
+import queue
+import threading
+import time
 from action import ActionInputError
+import identity
+import logbook
 import members
+import metrics
+
+# GPIO pin (BCM numbering) of the relay
+PIN = 4
+# number of seconds that the door stays unlocked
+PULSE = 3.0
 
 
-def setup():
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setup(4, GPIO.OUT)
+class GPIORelay(object):
+    """Relay connected to a GPIO pin of the Raspberry Pi.
 
+    Attributes
+    ----------
+    pin : int
+        GPIO pin of the relay in BCM numbering.
+
+    """
+    def __init__(self, pin=PIN):
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+        self.pin = pin
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.OUT)
 
-def set_on():
-    GPIO.output(4, GPIO.HIGH)
+    def high(self):
+        """Turn the relay on."""
+        self._gpio.output(self.pin, self._gpio.HIGH)
 
+    def low(self):
+        """Turn the relay off."""
+        self._gpio.output(self.pin, self._gpio.LOW)
 
-def set_off():
-    GPIO.output(4, GPIO.LOW)
+
+class FakeRelay(object):
+    """Relay that only records its changes, for running without a Raspberry Pi.
+
+    Attributes
+    ----------
+    changes : list of (float, bool)
+        Time (`time.monotonic`) of each change and whether the relay was turned on.
+
+    """
+    def __init__(self):
+        self.changes = []
+
+    @property
+    def is_high(self):
+        """True if the relay is on."""
+        return bool(self.changes) and self.changes[-1][1]
+
+    def high(self):
+        """Turn the relay on."""
+        self.changes.append((time.monotonic(), True))
+
+    def low(self):
+        """Turn the relay off."""
+        self.changes.append((time.monotonic(), False))
+
+
+class DoorActuator(object):
+    """Thread that holds the relay of the door on for a pulse after each request.
+
+    Attributes
+    ----------
+    relay : GPIORelay or FakeRelay
+        Relay of the door lock. Default is the relay on the GPIO pin, set up when the thread starts.
+    pulse : float
+        Number of seconds that the relay stays on after the last request.
+    latencies : collections.deque of float
+        Number of seconds between each of the recent messages that opened the door and the relay
+        turning on.
+
+    """
+    def __init__(self, relay=None, pulse=PULSE):
+        self.relay = relay
+        self.pulse = pulse
+        self.latencies = collections.deque(maxlen=100)
+        self._requests = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Set up the relay and start the thread that drives it."""
+        with self._lock:
+            if self._thread is None:
+                if self.relay is None:
+                    self.relay = GPIORelay()
+                self._thread = threading.Thread(target=self._run, name='door', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Turn the relay off and stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._requests.put(None)
+            thread.join()
+
+    def open(self, requested=None):
+        """Turn the relay on, or keep it on for longer if it is already on.
+
+        Parameters
+        ----------
+        requested : float
+            Time (`time.time`) of the message that asked for the door to be opened.
+            Default is the time of the call.
+
+        """
+        self.start()
+        self._requests.put(time.time() if requested is None else requested)
+
+    def _run(self):
+        """Turn the relay on for each request and off once the last pulse is over."""
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                requested = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                self.relay.low()
+                deadline = None
+                continue
+            if requested is None:
+                self.relay.low()
+                return
+            if deadline is None:
+                self.relay.high()
+                latency = time.time() - requested
+                self.latencies.append(latency)
+                if metrics.enabled:
+                    metrics.set_gauge('door_latency_seconds', latency)
+            # overlapping requests extend the pulse
+            deadline = time.monotonic() + self.pulse
+
+
+actuator = DoorActuator()
 
 
 def set_open():
-    setup()
-    set_on()
-    Timer(3.0, set_off).start()
+    """Unlock the door for a pulse."""
+    actuator.open()
 
 
 def has_permission(cursor, user):
@@ -36,15 +168,13 @@ def has_permission(cursor, user):
         Can be name, userid, slack id or id.
 
     """
-    cursor.execute('SELECT door_permission FROM members WHERE name=? OR userid=? OR slack_id=? OR '
-                   'id=?', (user,)*4)
-    rows = cursor.fetchall()
+    rows = identity.index(cursor.connection).find(user)
 
     if len(rows) > 1:
         raise ActionInputError('I found more than one person that goes by the identification, {0}'
                                ''.format(user))
     else:
-        return len(rows) == 1 and rows[0][0] == 'yesdoor'
+        return len(rows) == 1 and rows[0]['door_permission'] == 'yesdoor'
 
 
 def add(db_conn, user, user_to_add):
@@ -60,19 +190,16 @@ def add(db_conn, user, user_to_add):
         User to add to the database.
 
     """
-    cursor = db_conn.cursor()
-    cursor.execute('SELECT id FROM members WHERE name=? OR userid=? OR slack_id=? OR '
-                   'id=?', (user_to_add,)*4)
-    rows = cursor.fetchall()
+    rows = identity.index(db_conn).find(user_to_add)
     if len(rows) > 1:
         raise ActionInputError('I found more than one person that goes by {0}'.format(user_to_add))
     elif len(rows) == 0:
         raise ActionInputError('I could not find anyone that goes by {0}'.format(user_to_add))
     else:
-        members.modify(db_conn, user, 'door_permission', 'yesdoor', 'id', rows[0][0])
+        members.modify(db_conn, user, 'door_permission', 'yesdoor', 'id', rows[0]['id'])
 
 
-def open_door(db_conn, user):
+def open_door(db_conn, user, msg=None):
     """Open the door.
 
     Parameters
@@ -81,14 +208,19 @@ def open_door(db_conn, user):
         Database connection object.
     user : str
         Person who wants to open the door.
+    msg : dict
+        Parsed Slack message that asked for the door to be opened.
+        Its time stamp is used to measure how long it took to open the door.
 
     """
     cursor = db_conn.cursor()
     if has_permission(cursor, user):
-        set_open()
-        cursor.execute("INSERT INTO doorlog (time, userid) VALUES (?,?)",
-                       (str(datetime.datetime.now()), user),)
-        db_conn.commit()
+        actuator.open(float(msg['time']) if msg else None)
+        logbook.writer.append(db_conn, 'doorlog', user)
+        if metrics.enabled:
+            metrics.inc('door_opens_total', result='opened')
         raise ActionInputError('Bleep bloop')
     else:
+        if metrics.enabled:
+            metrics.inc('door_opens_total', result='denied')
         raise ActionInputError("I'm sorry, {0}, but I'm afraid I can't do that.".format(user))
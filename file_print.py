@@ -1,15 +1,24 @@
-import os
-import shutil
-from subprocess import call
 import urllib.request
 from action import ActionInputError
+import members
+import metrics
+from spooler import Spooler
+import uploads
 
+# command used to send files to the printer
+LPR = 'lpr'
+PRINTER = 'HP_LaserJet_400_color_M451dw'
+# print jobs run in the background, one at a time for each printer
+spool = Spooler()
 
-def upload(msg):
+
+def upload(db_conn, msg):
     """Download the file provided in the Slack message data.
 
     Parameters
     ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
     msg : dict
         Dictionary that contains the key 'download' and the url as the key.
 
@@ -24,20 +33,29 @@ def upload(msg):
     # TODO: probably should put in some sort of limitation to the files that can be uploaded
     # if os.path.splitext(filename)[-1] != '.pdf':
     #     raise ActionInputError('You can only upload pdf files.')
-    with urllib.request.urlopen(url) as response, open(os.path.join('/tmp', filename), 'wb') as fh:
-        shutil.copyfileobj(response, fh)
+    with urllib.request.urlopen(url) as response:
+        try:
+            uploads.store(db_conn, filename, response)
+        except uploads.UploadTooLarge:
+            raise ActionInputError('The file is too big. I can only take files up to {0} MB.'
+                                   ''.format(uploads.MAX_SIZE // 1024 // 1024))
     raise ActionInputError('Just to let you know, the file name is stored all in lower case and all'
                            ' of the spaces are converted to underscores. For example, '
                            '`Some\ File.sh` is changed to `some_file.sh`.')
 
 
-def file_print(filename, sided='double', color='black', quality='economy', pages=''):
-    """Print provided file in the tmp directory.
+def file_print(db_conn, user, filename, sided='double', color='black', quality='economy',
+               pages=''):
+    """Queue the latest uploaded file with the provided name for printing.
 
     Parameters
     ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+    user : str
+        User that is printing.
     filename : str
-        Name of the file stored in the tmp directory.
+        Name of the uploaded file.
     sided : {'single', 'double'}
         Number of sides on the paper to print.
         Default is double sided printing.
@@ -52,9 +70,12 @@ def file_print(filename, sided='double', color='black', quality='economy', pages
         Default is all pages.
 
     """
-    filename = os.path.join('/tmp', filename)
+    path = uploads.path(db_conn, filename)
+    if path is None:
+        raise ActionInputError('I could not find a file called {0}. You must upload it first.'
+                               ''.format(filename))
 
-    command = ['lpr', '-P', 'HP_LaserJet_400_color_M451dw']
+    command = [LPR, '-P', PRINTER, '-T', filename]
     if sided == 'single':
         command += ['-o', 'sides=one-sided']
     elif sided == 'double':
@@ -84,7 +105,62 @@ def file_print(filename, sided='double', color='black', quality='economy', pages
     # page size
     command += ['-o', 'media=Letter']
     # print file
-    command.append(filename)
+    command.append(path)
+
+    job_id = spool.submit(db_conn, PRINTER, user, filename, command)
+    if metrics.enabled:
+        metrics.inc('print_jobs_total')
+    raise ActionInputError('Bleep bloop. Your print job number is {0}. You can check on it with '
+                           '`print status` or cancel it with `print cancel {0}`.'.format(job_id))
+
+
+def status(db_conn, user):
+    """Show the print jobs that are waiting and the last few jobs of the user.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+    user : str
+        User that is checking on their print jobs.
+
+    """
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT id, userid, name, status, time FROM print_jobs "
+                   "WHERE status IN ('queued', 'printing') "
+                   "UNION SELECT * FROM (SELECT id, userid, name, status, time FROM print_jobs "
+                   "WHERE userid=? ORDER BY id DESC LIMIT 5) ORDER BY id", (user,))
+    rows = cursor.fetchall()
+    if len(rows) == 0:
+        raise ActionInputError('There are no print jobs.')
+
+    message = '{:<8}{:<20}{:<40}{:<12}{:<28}\n'.format('Job', 'User', 'File', 'Status', 'Time')
+    for row in rows:
+        message += '{:<8}{:<20}{:<40}{:<12}{:<28}\n'.format(*row)
+    raise ActionInputError('\n' + message)
+
+
+def cancel(db_conn, user, job_id):
+    """Cancel a print job.
 
-    call(command)
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+    user : str
+        User that is cancelling the print job.
+        Needs to own the job or be an administrator.
+    job_id : str
+        ID of the print job.
+
+    """
+    cursor = db_conn.cursor()
+    cursor.execute('SELECT userid FROM print_jobs WHERE id=?', (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ActionInputError('I could not find the print job number {0}.'.format(job_id))
+    elif row[0] != user and not members.has_permission(cursor, user):
+        raise ActionInputError('You can only cancel your own print jobs.')
+    elif not spool.cancel(db_conn, job_id):
+        raise ActionInputError('The print job number {0} is already finished.'.format(job_id))
     raise ActionInputError('Bleep bloop.')
@@ -0,0 +1,199 @@
+"""Module for resolving the identification of a group member.
+
+Commands refer to people by their name, userid, slack id or database id. Instead of querying the
+members table with `WHERE name=? OR userid=? OR slack_id=? OR id=?` every time, the members are
+kept in memory and indexed by each of these keys. Changes made through `members` refresh the index
+at once, and changes made by other connections or processes, e.g. the Brain or a manual edit of
+the database, are picked up within a second through `PRAGMA data_version`. If `timings` is enabled,
+the lookups are accumulated as the `identity` stage of the running command.
+
+"""
+import threading
+import time
+import database
+import timings
+
+KEYS = ('name', 'userid', 'slack_id', 'id')
+
+# one index per database, or per connection if it is not managed by `database.Database`
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def index(db_conn):
+    """Return the identity index of the members table in the given database.
+
+    The index is built on the first call and is reused afterwards.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection or database.Database
+        Database connection object.
+        Connections of the same `database.Database` share one index.
+
+    Returns
+    -------
+    index : IdentityIndex
+        Index of the members in the database.
+
+    """
+    # the connections of each thread belong to the same database
+    db_conn = getattr(db_conn, 'database', None) or db_conn
+    with _indexes_lock:
+        try:
+            return _indexes[db_conn]
+        except KeyError:
+            _indexes[db_conn] = IdentityIndex(db_conn)
+            return _indexes[db_conn]
+
+
+class IdentityIndex(object):
+    """In-memory index of the members table.
+
+    Attributes
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+    members : dict of int to dict
+        Database id of each member to the columns of the member.
+    keys : dict of str to (dict of str to set of int)
+        Each identifying column to the values of that column and the ids of the members that have
+        that value.
+    check_interval : float
+        Smallest number of seconds between checks for changes to the database in each thread.
+
+    """
+    def __init__(self, db_conn, check_interval=1.0):
+        self.db_conn = db_conn
+        self.members = {}
+        self.keys = {key: {} for key in KEYS}
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # last check of the connection of each thread
+        self._local = threading.local()
+        self.reload()
+
+    def _add(self, member):
+        """Add the member to the indexes."""
+        self.members[member['id']] = member
+        for key in KEYS:
+            value = member[key]
+            if value is None:
+                continue
+            self.keys[key].setdefault(str(value), set()).add(member['id'])
+
+    def _remove(self, member_id):
+        """Remove the member from the indexes."""
+        member = self.members.pop(member_id, None)
+        if member is None:
+            return
+        for key in KEYS:
+            value = member[key]
+            if value is None:
+                continue
+            ids = self.keys[key].get(str(value), set())
+            ids.discard(member_id)
+            if not ids:
+                self.keys[key].pop(str(value), None)
+
+    def _select(self, where='', vals=()):
+        """Select members from the database as dictionaries."""
+        cursor = self.db_conn.cursor()
+        cursor.execute('SELECT * FROM members {0}'.format(where), vals)
+        columns = [i[0] for i in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _version(self):
+        """Return what identifies the state of the database as seen by the calling thread.
+
+        The data version of a connection changes when another connection commits, and its total
+        number of changes grows when it writes, so that together they change whenever the members
+        table may have changed.
+
+        """
+        if isinstance(self.db_conn, database.Database):
+            db_conn = self.db_conn.connection()
+        else:
+            db_conn = self.db_conn
+        return (id(db_conn), db_conn.execute('PRAGMA data_version').fetchone()[0],
+                db_conn.total_changes)
+
+    def check(self):
+        """Reload the index if the database changed since the last check of the calling thread.
+
+        The database is checked at most once every `check_interval` in each thread.
+
+        """
+        now = time.monotonic()
+        checked = getattr(self._local, 'checked', None)
+        if checked is not None and now - checked < self.check_interval:
+            return
+        self._local.checked = now
+        # the first check of a thread cannot tell what changed since the index was built
+        if getattr(self._local, 'version', None) != self._version():
+            self.reload()
+
+    def reload(self):
+        """Rebuild the index from the members table."""
+        self._local.version = self._version()
+        rows = self._select()
+        with self._lock:
+            self.members = {}
+            self.keys = {key: {} for key in KEYS}
+            for member in rows:
+                self._add(member)
+
+    def refresh(self, *member_ids):
+        """Update the index for the members with the given database ids.
+
+        Members that are no longer in the database are removed from the index.
+
+        Parameters
+        ----------
+        member_ids : list of int
+            Database ids of the members that were added or modified.
+
+        """
+        for member_id in member_ids:
+            rows = self._select('WHERE id=?', (member_id,))
+            with self._lock:
+                for stale_id in set([member_id] + [row['id'] for row in rows]):
+                    try:
+                        self._remove(int(stale_id))
+                    except (TypeError, ValueError):
+                        pass
+                for member in rows:
+                    self._add(member)
+
+    def find(self, identifier, keys=KEYS):
+        """Find the members that go by the given identification.
+
+        Parameters
+        ----------
+        identifier : str
+            Identification of the member.
+            Can be name, userid, slack id or id.
+        keys : tuple of str
+            Columns that are checked against the identification.
+            Default is all of name, userid, slack id and id.
+
+        Returns
+        -------
+        members : list of dict
+            Columns of each member that matches the identification.
+            More than one member means that the identification is ambiguous.
+
+        """
+        timed = timings.enabled
+        if timed:
+            start = time.perf_counter()
+        self.check()
+        identifier = str(identifier)
+        with self._lock:
+            ids = set()
+            for key in keys:
+                ids.update(self.keys[key].get(identifier, ()))
+            members = [self.members[i] for i in sorted(ids)]
+        if timed:
+            timings.accumulate('identity', time.perf_counter() - start)
+        return members
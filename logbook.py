@@ -0,0 +1,148 @@
+"""Module for writing the door and quiet logs behind the commands.
+
+Rows of the logs are queued in memory and are inserted in batches by a background thread, so that
+opening the door or shushing a channel does not wait for a commit. The queue is flushed when it
+reaches a number of rows, after an interval, and when the bot stops.
+
+"""
+import datetime
+import queue
+import sqlite3
+import threading
+import time
+import database
+import migrations
+
+# logs that can be written, each with the columns (time, userid)
+TABLES = ('doorlog', 'quietlog')
+
+
+class LogWriter(object):
+    """Queue of log rows that are inserted in batches.
+
+    Attributes
+    ----------
+    interval : float
+        Largest number of seconds that a row waits before it is written.
+    max_rows : int
+        Number of waiting rows at which they are written without waiting for the interval.
+
+    """
+    def __init__(self, interval=5.0, max_rows=100):
+        self.interval = interval
+        self.max_rows = max_rows
+        self._rows = queue.Queue()
+        self._thread = None
+        self._db_conn = None
+        self._db_path = None
+        self._database = None
+        self._lock = threading.Lock()
+
+    def append(self, db_conn, table, user, when=None):
+        """Queue a row of the log.
+
+        Parameters
+        ----------
+        db_conn : sqlite3.Connection
+            Database connection object.
+            The rows are written by a connection of their own to the same database.
+        table : {'doorlog', 'quietlog'}
+            Log to which the row is added.
+        user : str
+            User that is logged.
+        when : datetime.datetime
+            Time that is logged.
+            Default is the time of the call.
+
+        """
+        if table not in TABLES:
+            raise ValueError('Log must be one of {0}.'.format(', '.join(TABLES)))
+        self.start(db_conn)
+        self._rows.put((table, migrations.format_time(when or datetime.datetime.now()), user))
+
+    def start(self, db_conn):
+        """Start the thread that writes the rows to the database of the given connection."""
+        with self._lock:
+            if self._thread is None:
+                self._db_conn = db_conn
+                self._database = getattr(db_conn, 'database', None)
+                self._db_path = database.database_path(db_conn)
+                self._thread = threading.Thread(target=self._run, name='logbook', daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout=None):
+        """Write the waiting rows and wait until they are committed.
+
+        Parameters
+        ----------
+        timeout : float
+            Largest number of seconds to wait.
+            Default waits until the rows are written.
+
+        """
+        if self._thread is None:
+            return
+        flushed = threading.Event()
+        self._rows.put(flushed)
+        flushed.wait(timeout)
+
+    def stop(self):
+        """Write the waiting rows and stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._rows.put(None)
+            thread.join()
+
+    def _connect(self):
+        """Return the connection used to write the rows."""
+        if self._database is not None:
+            return self._database.connection()
+        # in-memory databases cannot be opened twice
+        if not self._db_path:
+            return self._db_conn
+        return sqlite3.connect(self._db_path, timeout=30)
+
+    def _write(self, db_conn, rows):
+        """Insert the rows in one transaction."""
+        if not rows:
+            return
+        by_table = {}
+        for table, when, user in rows:
+            by_table.setdefault(table, []).append((when, user))
+        try:
+            with database.transaction(db_conn):
+                for table, values in by_table.items():
+                    db_conn.executemany('INSERT INTO {0} (time, userid) VALUES (?,?)'
+                                        ''.format(table), values)
+        except sqlite3.Error as error:
+            print('Could not write {0} rows of the logs: {1}'.format(len(rows), error))
+
+    def _run(self):
+        """Write the rows once there are enough of them or they have waited long enough."""
+        db_conn = self._connect()
+        rows = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._rows.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if isinstance(item, tuple) and item:
+                rows.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.interval
+                if len(rows) < self.max_rows:
+                    continue
+            # too many rows, waited too long, flush (an event), or stop (None)
+            self._write(db_conn, rows)
+            rows = []
+            deadline = None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+
+writer = LogWriter()
@@ -1,5 +1,8 @@
 """Module for managing group member database."""
 from action import ActionInputError
+import database
+import identity
+import migrations
 import utils
 
 
@@ -15,15 +18,13 @@ def has_permission(cursor, user):
         Can be name, userid, slack id or id.
 
     """
-    cursor.execute('SELECT permission FROM members WHERE name=? OR userid=? OR slack_id=? OR '
-                   'id=?', (user,)*4)
-    rows = cursor.fetchall()
+    rows = identity.index(cursor.connection).find(user)
 
     if len(rows) > 1:
         raise ActionInputError('I found more than one person that goes by the identification, {0}'
                                ''.format(user))
     else:
-        return len(rows) == 1 and rows[0][0] == 'admin'
+        return len(rows) == 1 and rows[0]['permission'] == 'admin'
 
 
 def add(db_conn, user, name, userid, slack_id, email, role, permission, door_permission):
@@ -55,10 +56,11 @@ def add(db_conn, user, name, userid, slack_id, email, role, permission, door_per
     """
     cursor = db_conn.cursor()
     if has_permission(cursor, user):
-        cursor.execute('INSERT INTO members (name, userid, slack_id, email, role, permission,'
-                       ' door_permission) VALUES (?,?,?,?,?,?,?)',
-                       (name, userid, slack_id, email, role, permission, door_permission))
-        db_conn.commit()
+        with database.transaction(db_conn):
+            cursor.execute('INSERT INTO members (name, userid, slack_id, email, role, permission,'
+                           ' door_permission) VALUES (?,?,?,?,?,?,?)',
+                           (name, userid, slack_id, email, role, permission, door_permission))
+        identity.index(db_conn).refresh(cursor.lastrowid)
     else:
         raise ActionInputError("You do not have the permission to add a new user.")
 
@@ -73,9 +75,12 @@ def modify(db_conn, user, item, to_val, *identifiers):
     user : str
         User that wants to change the information on a user.
     item : str
-        One of 'id', 'name', 'userid', 'email', 'role', 'permission', 'door_permission'.
+        One of 'id', 'name', 'userid', 'email', 'role', 'permission', 'door_permission',
+        'dates_away'.
     to_val : str
         Value to which data is changed.
+        Dates away are given as pairs of dates (YYYY-MM-DD), each pair being one period, and they
+        replace the periods that the member had.
     identifiers : list
         List of alternating keys and values that identify the person.
 
@@ -97,8 +102,19 @@ def modify(db_conn, user, item, to_val, *identifiers):
                                'Could you be more specific?')
     elif (has_permission(cursor, user) or
           (user in rows[0] and item not in ['permission', 'door_permission'])):
-        cursor.execute('UPDATE members SET {0}=? WHERE id=?'.format(item), (to_val, rows[0][0]))
-        db_conn.commit()
+        with database.transaction(db_conn):
+            if item == 'dates_away':
+                cursor.execute('DELETE FROM away_periods WHERE member=?', (rows[0][0],))
+                cursor.executemany('INSERT INTO away_periods (member, start, end) VALUES (?,?,?)',
+                                   [(rows[0][0], start, end)
+                                    for start, end in migrations.away_periods(to_val)])
+            else:
+                cursor.execute('UPDATE members SET {0}=? WHERE id=?'.format(item),
+                               (to_val, rows[0][0]))
+        if item == 'id':
+            identity.index(db_conn).refresh(rows[0][0], to_val)
+        else:
+            identity.index(db_conn).refresh(rows[0][0])
         raise ActionInputError('Bleep bloop')
     else:
         raise ActionInputError("You do not have the permission to modify this user's information")
@@ -150,32 +166,87 @@ def list(db_conn, *column_identifiers):
     raise ActionInputError('\n' + message)
 
 
+def slack_users(slack_client, page_size=200):
+    """Generate the users of the Slack workspace, one page of users.list at a time.
+
+    Parameters
+    ----------
+    slack_client : SlackClient
+        Slack client.
+    page_size : int
+        Number of users requested in each page.
+
+    Yields
+    ------
+    user : dict
+        User object of the Slack Web API.
+
+    Raises
+    ------
+    ActionInputError
+        If Slack does not give the list of users.
+
+    """
+    cursor = ''
+    while True:
+        response = slack_client.api_call('users.list', limit=page_size, cursor=cursor)
+        if not response.get('ok'):
+            raise ActionInputError('I could not get the users from Slack: {0}'
+                                   ''.format(response.get('error', 'unknown error')))
+        for user in response.get('members', []):
+            yield user
+        cursor = response.get('response_metadata', {}).get('next_cursor', '')
+        if not cursor:
+            break
+
+
 def import_from_slack(slack_client, db_conn):
-    """Import the group member information from Slack Client."""
-    names = []
-    userids = []
-    slack_ids = []
-    emails = []
-    roles = []
-    permissions = []
-    doors = []
+    """Import the group member information from Slack Client.
 
-    cursor = db_conn.cursor()
+    New Slack users are added as members, and the name and email of the members whose Slack profile
+    changed since the last import are updated. The userid, the role and the permissions of the
+    existing members are not changed, because the receipts and the commands refer to members by
+    their userid.
 
-    for i in slack_client.api_call('users.list')['members']:
-        # check if already in database
-        cursor.execute("SELECT id FROM members WHERE slack_id = ?", (i['name'],))
-        if cursor.fetchone():
-            continue
-
-        names.append(i['profile'].get('real_name', ''))
-        userids.append(i['name'])
-        slack_ids.append(i['id'])
-        emails.append(i['profile'].get('email', ''))
-        roles.append('')
-        permissions.append('user')
-        doors.append('nodoor')
-    cursor.executemany('INSERT INTO members (name, userid, slack_id, email, role, permission, '
-                       'door_permission) VALUES (?,?,?,?,?,?,?)',
-                       zip(names, userids, slack_ids, emails, roles, permissions, doors))
-    db_conn.commit()
+    Parameters
+    ----------
+    slack_client : SlackClient
+        Slack client.
+    db_conn : sqlite3.Connection
+        Database connection object.
+
+    """
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT slack_id FROM members WHERE slack_id IS NOT NULL AND slack_id != ''")
+    slack_ids = {i[0] for i in cursor.fetchall()}
+    cursor.execute("SELECT marker FROM sync_markers WHERE name='slack users'")
+    row = cursor.fetchone()
+    last_sync = row[0] if row is not None else 0
+    # slack ids of the users added in this import, in case Slack lists someone twice
+    added = set()
+
+    inserts = []
+    updates = []
+    marker = last_sync
+    for i in slack_users(slack_client):
+        updated = i.get('updated', 0)
+        marker = max(marker, updated)
+        profile = i.get('profile', {})
+        if i['id'] not in slack_ids and i['id'] not in added:
+            inserts.append((profile.get('real_name', ''), i['name'], i['id'],
+                            profile.get('email', ''), '', 'user', 'nodoor'))
+            added.add(i['id'])
+        elif i['id'] in slack_ids and updated > last_sync:
+            updates.append((profile.get('real_name', ''), profile.get('email', ''), i['id']))
+
+    with database.transaction(db_conn):
+        cursor.executemany('INSERT INTO members (name, userid, slack_id, email, role, permission, '
+                           'door_permission) VALUES (?,?,?,?,?,?,?)', inserts)
+        cursor.executemany('UPDATE members SET name=?, email=? WHERE slack_id=?',
+                           updates)
+        cursor.execute("INSERT OR REPLACE INTO sync_markers (name, marker) "
+                       "VALUES ('slack users', ?)", (marker,))
+    if inserts or updates:
+        identity.index(db_conn).reload()
+    raise ActionInputError('I added {0} and updated {1} members from Slack.'
+                           ''.format(len(inserts), len(updates)))
@@ -0,0 +1,187 @@
+"""Module for exposing the health of the bot to monitoring.
+
+Counters and gauges are kept in memory and are served in the Prometheus text format by a small HTTP
+server on a background thread. Counting is off until `serve` (or `enable`) is called, so that the
+hooks in the commands cost one flag check when no one is scraping the bot.
+
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import threading
+
+PREFIX = 'ayerslab_bot_'
+# name to (type, help)
+DESCRIPTIONS = {
+    'messages_total': ('counter', 'Messages from Slack that were handled.'),
+    'rtm_lag_seconds': ('gauge', 'Seconds between the last message being sent and being read.'),
+    'commands_total': ('counter', 'Commands that were run, by command.'),
+    'command_errors_total': ('counter', 'Commands that failed unexpectedly, by command.'),
+    'speak_total': ('counter', 'Messages that the bot sent.'),
+    'api_calls_total': ('counter', 'Calls to the Slack Web API, by method.'),
+    'api_errors_total': ('counter', 'Calls to the Slack Web API that failed, by method.'),
+    'outbox_depth': ('gauge', 'Messages waiting to be sent.'),
+    'db_queries_total': ('counter', 'Statements run on the database.'),
+    'door_opens_total': ('counter', 'Requests to open the door, by result.'),
+    'door_latency_seconds': ('gauge', 'Seconds between the last message that opened the door and '
+                             'the relay turning on.'),
+    'print_jobs_total': ('counter', 'Print jobs that were queued.'),
+}
+
+enabled = False
+values = {}
+callbacks = {}
+_lock = threading.Lock()
+
+
+def enable(on=True):
+    """Turn the counting of the metrics on or off.
+
+    Parameters
+    ----------
+    on : bool
+        True to count the metrics.
+
+    """
+    global enabled
+    enabled = on
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter.
+
+    Parameters
+    ----------
+    name : str
+        Name of the metric without the prefix, e.g. `commands_total`.
+    amount : float
+        Amount by which the counter is increased.
+    labels : dict of str to str
+        Labels of the metric.
+
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        values[key] = values.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    """Set the value of a gauge.
+
+    Parameters
+    ----------
+    name : str
+        Name of the metric without the prefix, e.g. `rtm_lag_seconds`.
+    value : float
+        Value of the gauge.
+    labels : dict of str to str
+        Labels of the metric.
+
+    """
+    with _lock:
+        values[(name, tuple(sorted(labels.items())))] = value
+
+
+def register(name, func):
+    """Read the value of a metric from the given function whenever the metrics are served.
+
+    Parameters
+    ----------
+    name : str
+        Name of the metric without the prefix.
+    func : function
+        Function without arguments that returns the value of the metric.
+
+    """
+    with _lock:
+        callbacks[name] = func
+
+
+def count_query(statement):
+    """Count a statement run on the database.
+
+    Given to `sqlite3.Connection.set_trace_callback`.
+
+    """
+    if enabled:
+        inc('db_queries_total')
+
+
+def render():
+    """Return the metrics in the Prometheus text format.
+
+    Returns
+    -------
+    text : str
+        HELP and TYPE lines, followed by one line for each set of labels, for each metric.
+
+    """
+    with _lock:
+        samples = dict(values)
+        funcs = dict(callbacks)
+    for name, func in funcs.items():
+        try:
+            samples[(name, ())] = func()
+        except Exception as error:
+            print('Metric, {0}, could not be read: {1}'.format(name, error))
+
+    by_name = {}
+    for (name, labels), value in samples.items():
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = DESCRIPTIONS.get(name, ('untyped', ''))
+        lines.append('# HELP {0}{1} {2}'.format(PREFIX, name, help_text))
+        lines.append('# TYPE {0}{1} {2}'.format(PREFIX, name, kind))
+        for labels, value in sorted(by_name[name]):
+            label_text = ','.join('{0}="{1}"'.format(key, str(val).replace('\\', '\\\\')
+                                                     .replace('"', '\\"').replace('\n', '\\n'))
+                                  for key, val in labels)
+            lines.append('{0}{1}{2} {3}'.format(PREFIX, name,
+                                                 '{{{0}}}'.format(label_text) if labels else '',
+                                                 float(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answer GET /metrics with the metrics."""
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # scrapes are too frequent to print
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(port=9150, host='127.0.0.1'):
+    """Count the metrics and serve them over HTTP on a background thread.
+
+    Parameters
+    ----------
+    port : int
+        Port of the server.
+    host : str
+        Address to which the server is bound.
+        Default only accepts connections from the same machine.
+
+    Returns
+    -------
+    server : http.server.HTTPServer
+        Server that is running. Call `shutdown` to stop it.
+
+    """
+    server = _Server((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    enable(True)
+    return server
@@ -0,0 +1,208 @@
+"""Module for creating and upgrading the tables of ayerslab.db.
+
+The version of the schema is stored in the schema_version table. Each migration is applied once, in
+order, and all pending migrations are applied in a single transaction.
+
+"""
+import datetime
+import re
+
+
+def normalize_times(cursor, table):
+    """Rewrite the time column of the given log into fixed width ISO 8601 text.
+
+    The logs used to store `str(datetime.datetime.now())`, which drops the microseconds when they
+    are zero, so that the times did not sort correctly as text.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        Cursor object used to modify the database.
+    table : str
+        Name of the log table.
+
+    """
+    cursor.execute('SELECT id, time FROM {0}'.format(table))
+    updates = []
+    for row_id, time in cursor.fetchall():
+        for time_format in ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S']:
+            try:
+                time_obj = datetime.datetime.strptime(time, time_format)
+            except (TypeError, ValueError):
+                continue
+            updates.append((format_time(time_obj), row_id))
+            break
+    cursor.executemany('UPDATE {0} SET time=? WHERE id=?'.format(table), updates)
+
+
+def format_time(time_obj):
+    """Return the sortable text that is stored in the time columns of the logs.
+
+    Parameters
+    ----------
+    time_obj : datetime.datetime
+        Time that will be stored.
+
+    Returns
+    -------
+    time : str
+        Time in the form yyyy-mm-dd hh:mm:ss.ffffff
+
+    """
+    return time_obj.isoformat(' ', 'microseconds')
+
+
+def away_periods(dates_away):
+    """Return the periods in the free text away dates of a member.
+
+    Parameters
+    ----------
+    dates_away : str
+        Text with dates formatted as YYYY-MM-DD.
+        Each consecutive pair of dates (once sorted) is one period.
+
+    Returns
+    -------
+    periods : list of 2-tuple of str
+        Start and end dates of each period.
+
+    """
+    dates = sorted(re.findall(r'\d\d\d\d-\d\d-\d\d', dates_away or ''))
+    return list(zip(dates[0::2], dates[1::2]))
+
+
+def parse_away_dates(cursor):
+    """Copy the free text away dates of the members into the away_periods table.
+
+    Older databases stored the days that a member is away as text in the dates_away column of the
+    members table. Each consecutive pair of dates in the text is one period.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        Cursor object used to modify the database.
+
+    """
+    cursor.execute('PRAGMA table_info(members)')
+    if 'dates_away' not in [i[1] for i in cursor.fetchall()]:
+        return
+    cursor.execute('SELECT id, dates_away FROM members')
+    periods = []
+    for member_id, dates_away in cursor.fetchall():
+        periods.extend((member_id, start, end) for start, end in away_periods(dates_away))
+    cursor.executemany('INSERT INTO away_periods (member, start, end) VALUES (?,?,?)', periods)
+
+
+# list of (description, list of SQL statements or functions of the cursor), in order
+MIGRATIONS = [
+    ('create tables',
+     ['CREATE TABLE IF NOT EXISTS members (id INTEGER PRIMARY KEY, name TEXT, '
+      'userid TEXT NOT NULL, slack_id TEXT, email TEXT, role TEXT, permission TEXT, '
+      'door_permission TEXT)',
+      'CREATE TABLE IF NOT EXISTS doorlog (id INTEGER PRIMARY KEY, time TEXT NOT NULL, '
+      'userid TEXT NOT NULL)',
+      'CREATE TABLE IF NOT EXISTS quietlog (id INTEGER PRIMARY KEY, time TEXT NOT NULL, '
+      'userid TEXT NOT NULL)',
+      'CREATE TABLE IF NOT EXISTS money (id INTEGER PRIMARY KEY, lender TEXT NOT NULL, '
+      'debtor TEXT NOT NULL, amount REAL NOT NULL, description TEXT, '
+      'confirm_lender_receipt TEXT, confirm_debtor_receipt TEXT, '
+      'confirm_lender_payment TEXT, confirm_debtor_payment TEXT)',
+      'CREATE TABLE IF NOT EXISTS group_meetings (id INTEGER PRIMARY KEY, date TEXT NOT NULL, '
+      'presenter INTEGER, chair INTEGER, title TEXT)']),
+    ('index lookups',
+     ['CREATE INDEX IF NOT EXISTS members_name ON members (name)',
+      'CREATE INDEX IF NOT EXISTS members_userid ON members (userid)',
+      'CREATE INDEX IF NOT EXISTS members_slack_id ON members (slack_id)',
+      'CREATE INDEX IF NOT EXISTS money_lender ON money (lender)',
+      'CREATE INDEX IF NOT EXISTS money_debtor ON money (debtor)',
+      'CREATE INDEX IF NOT EXISTS group_meetings_date ON group_meetings (date)',
+      'CREATE INDEX IF NOT EXISTS group_meetings_presenter ON group_meetings (presenter, date)',
+      'CREATE INDEX IF NOT EXISTS group_meetings_chair ON group_meetings (chair, date)']),
+    ('sortable log times',
+     [lambda cursor: normalize_times(cursor, 'doorlog'),
+      lambda cursor: normalize_times(cursor, 'quietlog'),
+      'CREATE INDEX IF NOT EXISTS doorlog_time ON doorlog (time)',
+      'CREATE INDEX IF NOT EXISTS quietlog_time ON quietlog (time)']),
+    ('upload store',
+     ['CREATE TABLE IF NOT EXISTS uploads (id INTEGER PRIMARY KEY, name TEXT NOT NULL, '
+      'digest TEXT NOT NULL, size INTEGER, time TEXT)',
+      'CREATE INDEX IF NOT EXISTS uploads_name ON uploads (name, id)']),
+    ('print spooler',
+     ['CREATE TABLE IF NOT EXISTS print_jobs (id INTEGER PRIMARY KEY, printer TEXT NOT NULL, '
+      'userid TEXT, name TEXT, command TEXT NOT NULL, status TEXT NOT NULL, time TEXT, '
+      'finished TEXT, error TEXT)',
+      'CREATE INDEX IF NOT EXISTS print_jobs_status ON print_jobs (status)',
+      'CREATE INDEX IF NOT EXISTS print_jobs_userid ON print_jobs (userid, id)']),
+    ('scheduled jobs',
+     ['CREATE TABLE IF NOT EXISTS scheduled_jobs (name TEXT PRIMARY KEY, cron TEXT NOT NULL, '
+      'next_run TEXT NOT NULL, last_run TEXT)']),
+    ('timed actions',
+     ['CREATE TABLE IF NOT EXISTS timed_actions (id INTEGER PRIMARY KEY, action TEXT NOT NULL, '
+      'option TEXT NOT NULL, inputs TEXT NOT NULL, interval INTEGER NOT NULL, last_time REAL)']),
+    ('away periods',
+     ['CREATE TABLE IF NOT EXISTS away_periods (id INTEGER PRIMARY KEY, member INTEGER NOT NULL, '
+      'start TEXT NOT NULL, end TEXT NOT NULL)',
+      'CREATE INDEX IF NOT EXISTS away_periods_member ON away_periods (member, start)',
+      parse_away_dates]),
+    ('sync markers',
+     ['CREATE TABLE IF NOT EXISTS sync_markers (name TEXT PRIMARY KEY, marker REAL NOT NULL)']),
+]
+
+
+def version(db_conn):
+    """Return the version of the schema of the database.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+
+    Returns
+    -------
+    version : int
+        Number of migrations that have been applied to the database.
+
+    """
+    cursor = db_conn.cursor()
+    cursor.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, '
+                   'description TEXT, applied TEXT)')
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    return cursor.fetchone()[0] or 0
+
+
+def migrate(db_conn):
+    """Apply the pending migrations to the database in one transaction.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+
+    Returns
+    -------
+    version : int
+        Version of the schema after the migrations.
+
+    """
+    current = version(db_conn)
+    if current >= len(MIGRATIONS):
+        return current
+
+    cursor = db_conn.cursor()
+    if db_conn.in_transaction:
+        db_conn.commit()
+    cursor.execute('BEGIN')
+    try:
+        for i, (description, steps) in enumerate(MIGRATIONS[current:], current + 1):
+            for step in steps:
+                if isinstance(step, str):
+                    cursor.execute(step)
+                else:
+                    step(cursor)
+            cursor.execute('INSERT INTO schema_version (version, description, applied) '
+                           'VALUES (?,?,?)', (i, description, format_time(datetime.datetime.now())))
+    except Exception:
+        db_conn.rollback()
+        raise
+    db_conn.commit()
+    return len(MIGRATIONS)
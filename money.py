@@ -1,4 +1,7 @@
+import heapq
 from action import ActionInputError, speak
+import database
+import identity
 import members
 
 
@@ -21,9 +24,7 @@ def add_receipt(db_conn, lender, debtor, amount, description):
     """
     cursor = db_conn.cursor()
     # find lender id
-    cursor.execute('SELECT userid FROM members WHERE name=? OR userid=? OR slack_id=? OR id=?',
-                   (lender,)*4)
-    rows = cursor.fetchall()
+    rows = identity.index(db_conn).find(lender)
     if len(rows) > 1:
         raise ActionInputError('I found more than one person that goes by the identification, {0}'
                                ''.format(lender))
@@ -31,9 +32,7 @@ def add_receipt(db_conn, lender, debtor, amount, description):
         raise ActionInputError('I could not find anyone that goes by the identification, {0}'
                                ''.format(lender))
     # find debtor id
-    cursor.execute('SELECT userid FROM members WHERE name=? OR userid=? OR slack_id=? OR id=?',
-                   (debtor,)*4)
-    rows = cursor.fetchall()
+    rows = identity.index(db_conn).find(debtor)
     if len(rows) > 1:
         raise ActionInputError('I found more than one person that goes by the identification, {0}'
                                ''.format(debtor))
@@ -46,11 +45,11 @@ def add_receipt(db_conn, lender, debtor, amount, description):
     except TypeError:
         raise ActionInputError('The amount of money given must be a number.')
 
-    cursor.execute('INSERT INTO money (lender, debtor, amount, description, confirm_lender_receipt,'
-                   ' confirm_debtor_receipt, confirm_lender_payment, confirm_debtor_payment) '
-                   'VALUES (?,?,?,?,?,?,?,?)',
-                   (lender, debtor, amount, description, 'no', 'no', 'no', 'no'))
-    db_conn.commit()
+    with database.transaction(db_conn):
+        cursor.execute('INSERT INTO money (lender, debtor, amount, description, '
+                       'confirm_lender_receipt, confirm_debtor_receipt, confirm_lender_payment, '
+                       'confirm_debtor_payment) VALUES (?,?,?,?,?,?,?,?)',
+                       (lender, debtor, amount, description, 'no', 'no', 'no', 'no'))
     raise ActionInputError('Bleep bloop.')
 
 
@@ -71,8 +70,8 @@ def remove_receipt(db_conn, user, receipt_id):
     cursor = db_conn.cursor()
     if members.has_permission(cursor, user):
         # probably should confirm
-        cursor.execute('DELETE FROM money WHERE id=?', (receipt_id, ))
-        db_conn.commit()
+        with database.transaction(db_conn):
+            cursor.execute('DELETE FROM money WHERE id=?', (receipt_id, ))
         raise ActionInputError('Bleep bloop.')
     else:
         raise ActionInputError('You do not have the permission.')
@@ -135,9 +134,9 @@ def confirm(db_conn, user, row_id, confirm_type):
     else:
         match_row = True
         if confirm_lender in ['no', '']:
-            cursor.execute('UPDATE money SET confirm_lender_{0}=? WHERE id=?'.format(confirm_type),
-                           ('yes', row_id))
-            db_conn.commit()
+            with database.transaction(db_conn):
+                cursor.execute('UPDATE money SET confirm_lender_{0}=? WHERE id=?'
+                               ''.format(confirm_type), ('yes', row_id))
         elif confirm_lender == 'yes':
             raise ActionInputError('You have already confirmed the {0} of receipt number {1}'
                                    ''.format(confirm_type, row_id))
@@ -157,9 +156,9 @@ def confirm(db_conn, user, row_id, confirm_type):
     else:
         match_row = True
         if confirm_debtor == 'no':
-            cursor.execute('UPDATE money SET confirm_debtor_{0}=? WHERE id=?'.format(confirm_type),
-                           ('yes', row_id))
-            db_conn.commit()
+            with database.transaction(db_conn):
+                cursor.execute('UPDATE money SET confirm_debtor_{0}=? WHERE id=?'
+                               ''.format(confirm_type), ('yes', row_id))
         elif confirm_debtor == 'yes':
             raise ActionInputError('You have already confirmed the {0} of receipt number {1}'
                                    ''.format(confirm_type, row_id))
@@ -176,15 +175,35 @@ def confirm(db_conn, user, row_id, confirm_type):
     raise ActionInputError('Bleep bloop.')
 
 
-def list(db_conn, last=0):
-    """List the receipt database.
+# user to the (WHERE command, values, page size, last receipt id) of the last page they listed
+pages = {}
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+
+def list(db_conn, user, *options):
+    """List the receipt database, one page at a time from the newest receipt.
 
     Parameters
     ----------
     db_conn : sqlite3.Connection
         Database connection object.
-    last : int
-        Number of entries (counting backwards) to print.
+    user : str
+        User that is listing the receipts.
+    options : list of str
+        Any of the following, in any order:
+            a number
+                Number of receipts in each page (default is 20).
+            `lender <name>`
+                Only the receipts where the given person is the lender.
+                Receipts that name the person by any of their identifiers are listed.
+            `debtor <name>`
+                Only the receipts where the given person is the debtor.
+                Receipts that name the person by any of their identifiers are listed.
+            `unconfirmed`
+                Only the receipts that have not been confirmed by everyone.
+            `next`
+                Next page of the last listing of the user.
 
     """
     col_names = ['Database ID',
@@ -196,17 +215,67 @@ def list(db_conn, last=0):
                  'Receipt Confirmed (D)',
                  'Payment Confirmed (L)',
                  'Payment Confirmed (D)']
+    usage = ('To list the receipts, you can give the number of receipts per page, `lender <name>`, '
+             '`debtor <name>`, `unconfirmed`, or `next` for the next page.')
+
+    if len(options) == 1 and options[0] == 'next':
+        if user not in pages:
+            raise ActionInputError('You need to list the receipts before asking for the next page.')
+        conditions, vals, page_size, last_id = pages[user]
+        conditions = conditions + ['id<?']
+        vals = vals + [last_id]
+    else:
+        conditions = []
+        vals = []
+        page_size = PAGE_SIZE
+        options = iter(options)
+        for option in options:
+            if option in ['lender', 'debtor']:
+                try:
+                    person = next(options)
+                except StopIteration:
+                    raise ActionInputError(usage)
+                # receipts may name the person by any of their identifiers
+                rows = identity.index(db_conn).find(person)
+                names = set([person])
+                if len(rows) == 1:
+                    names.update(str(rows[0][i]) for i in identity.KEYS if rows[0][i] is not None)
+                names = sorted(names)
+                vals.extend(names)
+                conditions.append('{0} IN ({1})'.format(option, ','.join('?' * len(names))))
+            elif option == 'unconfirmed':
+                conditions.append("'no' IN (confirm_lender_receipt, confirm_debtor_receipt, "
+                                  "confirm_lender_payment, confirm_debtor_payment)")
+            elif option.isdigit() and int(option) > 0:
+                page_size = min(int(option), MAX_PAGE_SIZE)
+            else:
+                raise ActionInputError(usage)
 
     cursor = db_conn.cursor()
+    where_command = 'WHERE {0}'.format(' AND '.join(conditions)) if conditions else ''
+    cursor.execute('SELECT * FROM money {0} ORDER BY id DESC LIMIT ?'.format(where_command),
+                   vals + [page_size + 1])
 
-    message = '{:<12}{:<30}{:<30}{:<8}{:<50}{:<23}{:<23}{:<23}{:<23}\n'.format(*col_names)
-    cursor.execute('SELECT * FROM money')
-    rows = cursor.fetchall()
-    for row in rows[-last:]:
+    lines = ['', '{:<12}{:<30}{:<30}{:<8}{:<50}{:<23}{:<23}{:<23}{:<23}'.format(*col_names)]
+    last_id = None
+    for row in cursor.fetchmany(page_size):
         # construct message
-        message += '{:<12}{:<30}{:<30}{:<8.2f}{:<50}{:<23}{:<23}{:<23}{:<23}\n'.format(*row)
+        lines.append('{:<12}{:<30}{:<30}{:<8.2f}{:<50}{:<23}{:<23}{:<23}{:<23}'.format(*row))
+        last_id = row[0]
+
+    if last_id is None:
+        pages.pop(user, None)
+        raise ActionInputError('There are no more receipts.')
+    elif cursor.fetchone() is None:
+        pages.pop(user, None)
+    else:
+        # remove the id condition of the previous page
+        if conditions and conditions[-1] == 'id<?':
+            conditions, vals = conditions[:-1], vals[:-1]
+        pages[user] = (conditions, vals, page_size, last_id)
+        lines.append('For older receipts, write `money list next`.')
 
-    raise ActionInputError('\n' + message)
+    raise ActionInputError('\n'.join(lines))
 
 
 def remind(client, db_conn, user, *remindees):
@@ -278,13 +347,241 @@ def remind(client, db_conn, user, *remindees):
             user_msg += all_confirmed.format(user)
 
         # find other user id
-        cursor.execute('SELECT slack_id FROM members WHERE name=? OR userid=? OR slack_id=? OR '
-                       'id=?', (other,)*4)
-        rows = cursor.fetchall()
+        rows = identity.index(db_conn).find(other)
         if len(rows) != 1:
             raise ValueError('Something went wrong in the members database.')
 
-        im_channel = client.api_call("im.open", user=rows[0][0])['channel']['id']
+        im_channel = client.api_call("im.open", user=rows[0]['slack_id'])['channel']['id']
         speak(client, im_channel, msg)
 
         raise ActionInputError(user_msg)
+
+
+def digest(db_conn):
+    """Group the receipts that have not been confirmed by everyone by the people involved.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+
+    Returns
+    -------
+    digest : dict of int to (dict, list of tuple)
+        Database id of each member to the columns of the member and their receipts that have not
+        been confirmed.
+        Receipts of people that cannot be found in the members database are left out.
+
+    """
+    index = identity.index(db_conn)
+    member_ids = {}
+
+    def find(person):
+        """Return the columns of the person if they are found in the members database."""
+        if person not in member_ids:
+            rows = index.find(person)
+            member_ids[person] = rows[0] if len(rows) == 1 else None
+        return member_ids[person]
+
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT * FROM money WHERE 'no' IN (confirm_lender_receipt, "
+                   "confirm_debtor_receipt, confirm_lender_payment, confirm_debtor_payment) "
+                   "ORDER BY id")
+    output = {}
+    for receipt in cursor.fetchall():
+        for person in set([receipt[1], receipt[2]]):
+            member = find(person)
+            if member is not None:
+                output.setdefault(member['id'], (member, []))[1].append(receipt)
+    return output
+
+
+def render_digest(member, receipts):
+    """Write the reminder of all of the receipts of one person.
+
+    Parameters
+    ----------
+    member : dict
+        Columns of the member in the members database.
+    receipts : list of tuple
+        Rows of the receipts that involve the member.
+
+    Returns
+    -------
+    message : str
+        Reminder for the member.
+
+    """
+    names = set(str(member[i]) for i in identity.KEYS if member[i] is not None)
+    lines = ['Here are the receipts that still need to be confirmed:']
+    for receipt_id, lender, debtor, amount, desc, conf_rl, conf_rd, conf_pl, conf_pd in receipts:
+        if lender in names:
+            line = 'Receipt number {0}: {1} owes you ${2:.2f} for \'{3}\'. '.format(
+                receipt_id, debtor, amount, desc)
+            own_conf = (conf_rl, conf_pl)
+            other = debtor
+            payment = 'Once you are paid, confirm it with `money confirm {0} payment`.'
+        else:
+            line = 'Receipt number {0}: you owe {1} ${2:.2f} for \'{3}\'. '.format(
+                receipt_id, lender, amount, desc)
+            own_conf = (conf_rd, conf_pd)
+            other = lender
+            payment = 'Please pay for it and confirm with `money confirm {0} payment`.'
+
+        if own_conf[0] == 'no':
+            line += 'Please confirm it with `money confirm {0} receipt`.'.format(receipt_id)
+        elif own_conf[1] == 'no':
+            line += payment.format(receipt_id)
+        else:
+            line += 'You are waiting for {0} to confirm.'.format(other)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def send_digest(client, db_conn):
+    """Send each person one message with all of their receipts that have not been confirmed.
+
+    Parameters
+    ----------
+    client : SlackClient
+        Slack client.
+    db_conn : sqlite3.Connection
+        Database connection object.
+
+    """
+    for member, receipts in digest(db_conn).values():
+        if not member['slack_id']:
+            continue
+        # e.g. deactivated accounts cannot be messaged
+        response = client.api_call("im.open", user=member['slack_id'])
+        if not response.get('ok', False):
+            print('Could not send the digest to {0}: {1}'.format(member['userid'],
+                                                                 response.get('error')))
+            continue
+        speak(client, response['channel']['id'], render_digest(member, receipts))
+
+
+def balances(db_conn):
+    """Net the receipts that have not been paid into the balance of each person.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+
+    Returns
+    -------
+    balances : dict of str to int
+        Person to the number of cents that they are owed (positive) or that they owe (negative).
+        People are identified by their userid when they can be found in the members database.
+
+    """
+    index = identity.index(db_conn)
+    userids = {}
+
+    def canonical(person):
+        """Return the userid of the person if they are found in the members database."""
+        if person not in userids:
+            rows = index.find(person)
+            userids[person] = rows[0]['userid'] if len(rows) == 1 else person
+        return userids[person]
+
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT lender, debtor, SUM(amount) FROM money "
+                   "WHERE confirm_lender_payment!='yes' OR confirm_debtor_payment!='yes' "
+                   "GROUP BY lender, debtor")
+    output = {}
+    for lender, debtor, amount in cursor.fetchall():
+        lender, debtor = canonical(lender), canonical(debtor)
+        cents = int(round(amount * 100))
+        output[lender] = output.get(lender, 0) + cents
+        output[debtor] = output.get(debtor, 0) - cents
+    return output
+
+
+def transfers(balances):
+    """Find a small set of transfers that settles the given balances.
+
+    The largest debt is repeatedly paid to the largest creditor, which takes at most one fewer
+    transfer than the number of people with a nonzero balance.
+
+    Parameters
+    ----------
+    balances : dict of str to int
+        Person to the number of cents that they are owed (positive) or that they owe (negative).
+
+    Returns
+    -------
+    transfers : list of (str, str, int)
+        Person paying, person being paid, and the number of cents transferred.
+
+    """
+    creditors = [(-cents, person) for person, cents in balances.items() if cents > 0]
+    debtors = [(cents, person) for person, cents in balances.items() if cents < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    output = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        cents = min(-credit, -debt)
+        output.append((debtor, creditor, cents))
+        if -credit > cents:
+            heapq.heappush(creditors, (credit + cents, creditor))
+        if -debt > cents:
+            heapq.heappush(debtors, (debt + cents, debtor))
+    return output
+
+
+def settle(client, db_conn, user, notify=''):
+    """Show the transfers that would settle all of the receipts that have not been paid.
+
+    Parameters
+    ----------
+    client : SlackClient
+        Slack client.
+    db_conn : sqlite3.Connection
+        Database connection object.
+    user : str
+        Name of the user settling the receipts.
+    notify : {'', 'notify'}
+        If `notify`, each person with a transfer gets one direct message with their transfers.
+        Needs to be an administrator.
+
+    """
+    if notify not in ['', 'notify']:
+        raise ActionInputError('To message everyone their transfers, write `money settle notify`.')
+
+    plan = transfers(balances(db_conn))
+    if len(plan) == 0:
+        raise ActionInputError('Everything is settled.')
+
+    message = '{:<30}{:<30}{:<8}\n'.format('From', 'To', 'Amount')
+    for payer, payee, cents in plan:
+        message += '{:<30}{:<30}{:<8.2f}\n'.format(payer, payee, cents / 100)
+
+    if notify == 'notify':
+        if not members.has_permission(db_conn.cursor(), user):
+            raise ActionInputError('You do not have the permission.')
+        # one message per person
+        messages = {}
+        for payer, payee, cents in plan:
+            amount = cents / 100
+            messages.setdefault(payer, []).append('You pay {0} ${1:.2f}.'.format(payee, amount))
+            messages.setdefault(payee, []).append('{0} pays you ${1:.2f}.'.format(payer, amount))
+        for person, lines in messages.items():
+            rows = identity.index(db_conn).find(person)
+            if len(rows) != 1 or not rows[0]['slack_id']:
+                message += 'I could not message {0}.\n'.format(person)
+                continue
+            response = client.api_call("im.open", user=rows[0]['slack_id'])
+            if not response.get('ok', False):
+                message += 'I could not message {0}.\n'.format(person)
+                continue
+            speak(client, response['channel']['id'],
+                  'To settle the money that is owed in the lab:\n{0}\nOnce paid, confirm the '
+                  'payments of the receipts with `money confirm <id> payment`.'
+                  ''.format('\n'.join(lines)))
+
+    raise ActionInputError('\n' + message)
@@ -0,0 +1,239 @@
+"""Module for sending messages to Slack without blocking the command handlers.
+
+Messages posted through the outbox are put in a queue and are sent by a dedicated thread. Messages
+for the same channel keep their order, consecutive messages for the same channel are merged into
+one post, and rate limited posts are retried after the time given by Slack. If `timings` is enabled,
+each post is timed as the `send` stage of the command that queued the message. If `metrics` is
+enabled, every call to the Slack Web API is counted by method, including each retry of a post.
+
+"""
+from collections import deque
+import queue
+import threading
+import time
+import metrics
+import timings
+
+# Slack truncates longer messages
+MAX_LENGTH = 4000
+
+
+class Outbox(object):
+    """Queue of outgoing messages in front of a Slack client.
+
+    Calls to `chat.postMessage` are queued and return at once. Every other attribute and API call is
+    passed through to the wrapped Slack client.
+
+    Attributes
+    ----------
+    client : SlackClient
+        Slack client that sends the messages.
+    merge_window : float
+        Number of seconds to wait for more messages to the same channel before sending.
+    max_retries : int
+        Number of times a post is retried after an error other than rate limiting.
+    backoff : float
+        Number of seconds before the first retry. The wait doubles after each retry.
+    sent : int
+        Number of posts sent.
+    failed : int
+        Number of posts that could not be sent.
+    latencies : collections.deque of float
+        Number of seconds between queueing and sending for the most recent messages.
+
+    """
+    def __init__(self, client, merge_window=0.1, max_retries=3, backoff=1.0):
+        self.client = client
+        self.merge_window = merge_window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=1000)
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def __getattr__(self, attr):
+        return getattr(self.client, attr)
+
+    def api_call(self, method, **kwargs):
+        """Queue the message if the method is `chat.postMessage`, otherwise call the Slack API.
+
+        Parameters
+        ----------
+        method : str
+            Method of the Slack Web API.
+        kwargs : dict
+            Arguments of the method.
+
+        Returns
+        -------
+        response : dict
+            Response of the Slack Web API.
+            Queued messages get `{'ok': True, 'queued': True}`.
+
+        """
+        if method != 'chat.postMessage':
+            if metrics.enabled:
+                metrics.inc('api_calls_total', method=method)
+            try:
+                response = self.client.api_call(method, **kwargs)
+            except Exception:
+                if metrics.enabled:
+                    metrics.inc('api_errors_total', method=method)
+                raise
+            if metrics.enabled and not response.get('ok', False):
+                metrics.inc('api_errors_total', method=method)
+            return response
+        self._queue.put((time.monotonic(), kwargs, timings.current() if timings.enabled else None))
+        return {'ok': True, 'queued': True}
+
+    @property
+    def depth(self):
+        """Number of messages waiting to be sent."""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Return the backlog and the send latency of the outbox.
+
+        Returns
+        -------
+        stats : dict
+            'depth' : int
+                Number of messages waiting to be sent.
+            'sent' : int
+                Number of posts sent.
+            'failed' : int
+                Number of posts that could not be sent.
+            'latency_mean' : float
+                Average number of seconds between queueing and sending of the recent messages.
+            'latency_max' : float
+                Largest number of seconds between queueing and sending of the recent messages.
+
+        """
+        latencies = list(self.latencies)
+        return {'depth': self.depth,
+                'sent': self.sent,
+                'failed': self.failed,
+                'latency_mean': sum(latencies) / len(latencies) if latencies else 0.0,
+                'latency_max': max(latencies) if latencies else 0.0}
+
+    def start(self):
+        """Start the thread that sends the messages."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Send the queued messages and stop the thread.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum number of seconds to wait for the queued messages to be sent.
+
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        """Send the queued messages until stopped."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # give the handler a moment to queue the rest of its messages
+            wait = item[0] + self.merge_window - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            batch = [item]
+            stopped = False
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopped = True
+                    break
+                batch.append(item)
+
+            for queued, kwargs, key in merge(batch):
+                self._send(queued, kwargs, key)
+            if stopped:
+                return
+
+    def _send(self, queued, kwargs, key=None):
+        """Post one message, retrying when rate limited or when the request fails."""
+        delay = self.backoff
+        retries = 0
+        while True:
+            timed = timings.enabled
+            if timed:
+                start = time.perf_counter()
+            if metrics.enabled:
+                metrics.inc('api_calls_total', method='chat.postMessage')
+            try:
+                response = self.client.api_call('chat.postMessage', **kwargs)
+            except Exception as error:
+                response = {'ok': False, 'error': str(error), 'retry': True}
+            if timed:
+                timings.record(key or '', 'send', time.perf_counter() - start)
+            if metrics.enabled and not response.get('ok', False):
+                metrics.inc('api_errors_total', method='chat.postMessage')
+
+            if response.get('ok', False):
+                self.sent += 1
+                now = time.monotonic()
+                self.latencies.extend(now - i for i in queued)
+                return
+            elif response.get('error') == 'ratelimited':
+                headers = response.get('headers', {})
+                time.sleep(float(headers.get('Retry-After', headers.get('retry-after', delay))))
+            elif response.get('retry', False) and retries < self.max_retries:
+                time.sleep(delay)
+                delay *= 2
+                retries += 1
+            else:
+                self.failed += 1
+                print('Could not send a message to {0}: {1}'.format(kwargs.get('channel'),
+                                                                     response.get('error')))
+                return
+
+
+def merge(batch):
+    """Merge the messages of the batch that go to the same channel.
+
+    Messages to the same channel keep their order. Merged messages are kept under `MAX_LENGTH`.
+
+    Parameters
+    ----------
+    batch : list of (float, dict, str)
+        Time at which each message was queued, the arguments of `chat.postMessage` and the path of
+        the command that queued it.
+
+    Returns
+    -------
+    merged : list of (list of float, dict, str)
+        Times at which the merged messages were queued, the arguments of `chat.postMessage` and the
+        path of the command of the first merged message.
+
+    """
+    merged = []
+    last = {}
+    for queued, kwargs, key in batch:
+        target = tuple(sorted((k, str(v)) for k, v in kwargs.items() if k != 'text'))
+        text = kwargs.get('text', '')
+        if target in last:
+            times, prev_kwargs, _ = merged[last[target]]
+            prev_text = prev_kwargs.get('text', '')
+            if len(prev_text) + len(text) + 1 <= MAX_LENGTH:
+                prev_kwargs['text'] = '{0}\n{1}'.format(prev_text, text)
+                times.append(queued)
+                continue
+        last[target] = len(merged)
+        merged.append(([queued], dict(kwargs), key))
+    return merged
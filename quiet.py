@@ -1,5 +1,5 @@
-import datetime
 import action
+import logbook
 
 
 def shush(client, db_conn, user, channel):
@@ -17,8 +17,6 @@ def shush(client, db_conn, user, channel):
         Channel that will be shushed.
 
     """
-    db_conn.execute("INSERT INTO quietlog (time, userid) VALUES (?,?)",
-                    (str(datetime.datetime.now()), user))
-    db_conn.commit()
+    logbook.writer.append(db_conn, 'quietlog', user)
     action.speak(client, channel, 'Shhhhhh', '')
     raise action.ActionInputError('Bleep bloop.')
@@ -0,0 +1,161 @@
+"""Module for running the bot on an asyncio event loop.
+
+Instead of reading the RTM firehose once every second, the runtime waits on the websocket of the
+Slack client and reads as soon as events arrive. Each parsed message is handled in a bounded pool of
+worker threads, so that a slow command does not hold up the commands of other channels. Messages
+from the same channel are handled in the order that they arrived.
+
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
+
+class Runtime(object):
+    """Event loop that reads from the Slack RTM API and dispatches the messages.
+
+    Attributes
+    ----------
+    client : SlackClient
+        Slack client that is connected to the RTM API.
+    parse : function
+        Generator function that turns the output of `rtm_read` into parsed messages.
+    handle : function
+        Function that is called with each parsed message from a worker thread.
+    timeout : float
+        Maximum number of seconds to wait for the websocket before reading anyway.
+    job_timeout : float
+        Number of seconds after which a message that is still being handled stops holding up the
+        later messages of its channel.
+        The thread that handles it keeps running, since threads cannot be killed.
+    on_timeout : function
+        Function that is called with the parsed message when its handling takes longer than
+        `job_timeout`.
+    loop : asyncio.AbstractEventLoop
+        Event loop on which the messages are read.
+    pool : concurrent.futures.ThreadPoolExecutor
+        Worker threads that handle the messages.
+
+    """
+    def __init__(self, client, parse, handle, timeout=1.0, workers=4, job_timeout=60.0,
+                 on_timeout=None):
+        self.client = client
+        self.parse = parse
+        self.handle = handle
+        self.timeout = timeout
+        self.job_timeout = job_timeout
+        self.on_timeout = on_timeout
+        self.loop = asyncio.new_event_loop()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')
+        self._tasks = set()
+        self._channels = {}
+        self._reader = None
+        self._error = None
+
+    def schedule(self, scheduler, max_sleep=3600):
+        """Run the due jobs of the scheduler in the worker threads.
+
+        The loop sleeps until the next job is due, but wakes at least every `max_sleep` seconds in
+        case the clock of the machine jumps.
+
+        Parameters
+        ----------
+        scheduler : scheduler.Scheduler
+            Scheduler of the recurring jobs.
+        max_sleep : float
+            Maximum number of seconds between checks of the scheduler.
+
+        """
+        async def run():
+            while True:
+                wait = scheduler.seconds_until_next()
+                await asyncio.sleep(max_sleep if wait is None else min(wait, max_sleep))
+                await self.loop.run_in_executor(self.pool, scheduler.run_due)
+        self._track(self.loop.create_task(run()))
+
+    def _track(self, future):
+        """Keep a reference to the future and stop the loop if it fails."""
+        self._tasks.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        """Forget the finished future and store its error."""
+        self._tasks.discard(future)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None and self._error is None:
+            self._error = error
+            self._reader.cancel()
+
+    async def _dispatch(self, msg, previous):
+        """Handle one parsed message after the previous message of the same channel."""
+        if previous is not None:
+            await asyncio.wait({previous})
+        job = self.loop.run_in_executor(self.pool, self.handle, msg)
+        self._track(job)
+        try:
+            await asyncio.wait_for(asyncio.shield(job), self.job_timeout)
+        except asyncio.TimeoutError:
+            if self.on_timeout is not None:
+                self.on_timeout(msg)
+
+    def _forget_channel(self, channel, task):
+        """Forget the last task of the channel once it is done."""
+        if self._channels.get(channel) is task:
+            del self._channels[channel]
+
+    async def _wait_for_events(self):
+        """Wait until the websocket has something to read or until the timeout."""
+        try:
+            fileno = self.client.server.websocket.sock.fileno()
+        except AttributeError:
+            fileno = -1
+        if fileno < 0:
+            await asyncio.sleep(self.timeout)
+            return
+
+        readable = self.loop.create_future()
+
+        def wake():
+            if not readable.done():
+                readable.set_result(None)
+
+        self.loop.add_reader(fileno, wake)
+        try:
+            await asyncio.wait_for(readable, self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.loop.remove_reader(fileno)
+
+    async def _read(self):
+        """Read from the firehose and start a task for each message."""
+        while True:
+            for msg in self.parse(self.client.rtm_read()):
+                channel = msg.get('channel')
+                task = self.loop.create_task(self._dispatch(msg, self._channels.get(channel)))
+                self._channels[channel] = task
+                task.add_done_callback(functools.partial(self._forget_channel, channel))
+                self._track(task)
+            await self._wait_for_events()
+
+    def run(self):
+        """Run the event loop until an unexpected error occurs.
+
+        Raises
+        ------
+        Exception
+            Error raised while handling a message.
+
+        """
+        self._reader = self.loop.create_task(self._read())
+        try:
+            self.loop.run_until_complete(self._reader)
+        except asyncio.CancelledError:
+            if self._error is None:
+                raise
+            raise self._error
+        finally:
+            self.pool.shutdown(wait=False)
+            self.loop.close()
@@ -0,0 +1,254 @@
+"""Module for running jobs on a recurring schedule.
+
+Jobs are scheduled with cron expressions and are kept in a min-heap of their next run times. The
+next run time of each job is stored in the scheduled_jobs table, so that a run that was missed while
+the bot was down is caught up when the bot starts again.
+
+"""
+import datetime
+import heapq
+import threading
+import time
+import traceback
+import database
+import migrations
+import timings
+
+# lower and upper bounds of minute, hour, day of month, month and day of week
+FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def parse_field(field, lower, upper):
+    """Return the values that the field of a cron expression allows.
+
+    Parameters
+    ----------
+    field : str
+        Field of the cron expression, e.g. `*`, `5`, `1-5`, `*/15`, or `1,3,5`.
+    lower : int
+        Smallest allowed value.
+    upper : int
+        Largest allowed value.
+
+    Returns
+    -------
+    values : set of int
+        Allowed values.
+
+    Raises
+    ------
+    ValueError
+        If the field cannot be understood.
+
+    """
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = lower, upper
+        elif '-' in part:
+            start, end = (int(i) for i in part.split('-'))
+        else:
+            start = end = int(part)
+        if not lower <= start <= end <= upper or step < 1:
+            raise ValueError('Cannot understand the cron field, {0}.'.format(field))
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron(object):
+    """Recurrence given by a cron expression.
+
+    Attributes
+    ----------
+    expression : str
+        Five space delimited fields: minute, hour, day of month, month, and day of week (0 is
+        Sunday).
+
+    """
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError('Cron expression must have five fields: {0}'.format(expression))
+        # 7 is also Sunday
+        fields[4] = fields[4].replace('7', '0')
+        self.expression = expression
+        (self.minutes, self.hours, self.days, self.months,
+         self.weekdays) = [parse_field(field, *bounds) for field, bounds in zip(fields,
+                                                                               FIELD_RANGES)]
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, time):
+        """Check if the date of the given time is allowed."""
+        day = time.day in self.days
+        weekday = (time.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return weekday
+        elif self._any_weekday:
+            return day
+        return day or weekday
+
+    def next_time(self, after):
+        """Return the first time after the given time that matches the expression.
+
+        Parameters
+        ----------
+        after : datetime.datetime
+            Time after which the next time is searched.
+
+        Returns
+        -------
+        time : datetime.datetime
+            Next time that matches the expression.
+
+        Raises
+        ------
+        ValueError
+            If no time matches the expression within the next five years.
+
+        """
+        time = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = after + datetime.timedelta(days=5 * 366)
+        while time <= limit:
+            if time.month not in self.months:
+                time = (time.replace(day=1, hour=0, minute=0)
+                        + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(time):
+                time = time.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif time.hour not in self.hours:
+                time = time.replace(minute=0) + datetime.timedelta(hours=1)
+            elif time.minute not in self.minutes:
+                time += datetime.timedelta(minutes=1)
+            else:
+                return time
+        raise ValueError('No time matches the cron expression, {0}.'.format(self.expression))
+
+
+class Scheduler(object):
+    """Min-heap of recurring jobs.
+
+    Attributes
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+    jobs : dict of str to (Cron, function)
+        Name of each job to its schedule and the function that it runs.
+    heap : list of (datetime.datetime, str)
+        Next run time and name of each job.
+
+    """
+    def __init__(self, db_conn):
+        self.db_conn = db_conn
+        self.jobs = {}
+        self.heap = []
+        self._lock = threading.Lock()
+
+    def register(self, name, expression, func):
+        """Schedule a recurring job.
+
+        If the job was already stored with the same schedule, its stored run time is kept, so that
+        a run that was missed while the bot was down is run as soon as possible.
+
+        Parameters
+        ----------
+        name : str
+            Name of the job.
+        expression : str
+            Cron expression for the schedule of the job.
+        func : function
+            Function that is run without arguments.
+
+        """
+        cron = Cron(expression)
+        cursor = self.db_conn.cursor()
+        cursor.execute('SELECT cron, next_run FROM scheduled_jobs WHERE name=?', (name,))
+        row = cursor.fetchone()
+        if row is not None and row[0] == expression:
+            next_run = datetime.datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S.%f')
+        else:
+            next_run = cron.next_time(datetime.datetime.now())
+            with database.transaction(self.db_conn):
+                cursor.execute('INSERT OR REPLACE INTO scheduled_jobs (name, cron, next_run) '
+                               'VALUES (?,?,?)',
+                               (name, expression, migrations.format_time(next_run)))
+        with self._lock:
+            self.jobs[name] = (cron, func)
+            heapq.heappush(self.heap, (next_run, name))
+
+    def seconds_until_next(self, now=None):
+        """Return the number of seconds until the next job is due.
+
+        Parameters
+        ----------
+        now : datetime.datetime
+            Current time.
+            Default is the time of the call.
+
+        Returns
+        -------
+        seconds : float
+            Number of seconds until the next job is due.
+            None if there are no jobs.
+
+        """
+        now = now or datetime.datetime.now()
+        with self._lock:
+            if not self.heap:
+                return None
+            return max((self.heap[0][0] - now).total_seconds(), 0)
+
+    def run_due(self, now=None):
+        """Run the jobs that are due.
+
+        The next run time of each job is stored before the job is run, so that a job that fails is
+        not run again until its next scheduled time. Missed runs are run only once. If `timings` is
+        enabled, each job is timed as the command `scheduled <name>`.
+
+        Parameters
+        ----------
+        now : datetime.datetime
+            Current time.
+            Default is the time of the call.
+
+        Returns
+        -------
+        names : list of str
+            Names of the jobs that were run.
+
+        """
+        now = now or datetime.datetime.now()
+        due = []
+        with self._lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, name = heapq.heappop(self.heap)
+                cron, func = self.jobs[name]
+                next_run = cron.next_time(now)
+                heapq.heappush(self.heap, (next_run, name))
+                due.append((name, func, next_run))
+
+        cursor = self.db_conn.cursor()
+        for name, func, next_run in due:
+            timed = timings.enabled
+            if timed:
+                key = 'scheduled {0}'.format(name)
+                previous = timings.begin(key)
+                start = time.perf_counter()
+            try:
+                with database.transaction(self.db_conn):
+                    cursor.execute('UPDATE scheduled_jobs SET next_run=?, last_run=? WHERE name=?',
+                                   (migrations.format_time(next_run), migrations.format_time(now),
+                                    name))
+                try:
+                    func()
+                except Exception:
+                    print('Scheduled job, {0}, failed:'.format(name))
+                    traceback.print_exc()
+            finally:
+                if timed:
+                    timings.record(key, 'run', time.perf_counter() - start)
+                    timings.end(previous)
+        return [i[0] for i in due]
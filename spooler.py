@@ -0,0 +1,216 @@
+"""Module for running print jobs in the background.
+
+Print jobs are recorded in the print_jobs table and are run by one thread per printer, so that the
+jobs of a printer are sent one at a time and the bot does not wait for them.
+
+"""
+import datetime
+import json
+import queue
+import sqlite3
+import subprocess
+import threading
+import database
+import migrations
+
+
+class Spooler(object):
+    """Queues of print jobs, one for each printer.
+
+    Attributes
+    ----------
+    queues : dict of str to queue.Queue
+        Printer to the ids of the jobs that are waiting to be run.
+
+    """
+    def __init__(self):
+        self.queues = {}
+        self._processes = {}
+        # jobs that a printer thread has taken from its queue and not finished
+        self._running = set()
+        self._cancelled = set()
+        self._lock = threading.Lock()
+
+    def submit(self, db_conn, printer, user, name, command):
+        """Record the print job and queue it for its printer.
+
+        Parameters
+        ----------
+        db_conn : sqlite3.Connection
+            Database connection object.
+        printer : str
+            Name of the printer.
+        user : str
+            User that is printing.
+        name : str
+            Name of the printed file.
+        command : list of str
+            Command that runs the print job.
+
+        Returns
+        -------
+        job_id : int
+            ID of the print job.
+
+        """
+        cursor = db_conn.cursor()
+        with database.transaction(db_conn):
+            cursor.execute('INSERT INTO print_jobs (printer, userid, name, command, status, time) '
+                           'VALUES (?,?,?,?,?,?)',
+                           (printer, user, name, json.dumps(command), 'queued',
+                            migrations.format_time(datetime.datetime.now())))
+        self._queue(printer, db_conn).put(cursor.lastrowid)
+        return cursor.lastrowid
+
+    def resume(self, db_conn):
+        """Queue the print jobs that were waiting when the bot last stopped.
+
+        Jobs that were being sent to the printer are not run again, because they may have been
+        printed already. They are marked `unknown`, so that their users can check the printer and
+        submit them again.
+
+        Parameters
+        ----------
+        db_conn : sqlite3.Connection
+            Database connection object.
+
+        """
+        cursor = db_conn.cursor()
+        with database.transaction(db_conn):
+            cursor.execute("UPDATE print_jobs SET status='unknown', finished=?, error=? "
+                           "WHERE status='printing'",
+                           (migrations.format_time(datetime.datetime.now()),
+                            'The bot stopped while the job was being printed.'))
+        cursor.execute("SELECT id, printer FROM print_jobs WHERE status='queued' ORDER BY id")
+        for job_id, printer in cursor.fetchall():
+            self._queue(printer, db_conn).put(job_id)
+
+    def cancel(self, db_conn, job_id):
+        """Cancel the print job.
+
+        Jobs that are waiting are removed from the queue, and jobs that are being sent to the
+        printer are stopped.
+
+        Parameters
+        ----------
+        db_conn : sqlite3.Connection
+            Database connection object.
+        job_id : int
+            ID of the print job.
+
+        Returns
+        -------
+        cancelled : bool
+            True if the job was waiting or being sent to the printer.
+
+        """
+        cursor = db_conn.cursor()
+        with database.transaction(db_conn):
+            cursor.execute("UPDATE print_jobs SET status='cancelled' "
+                           "WHERE id=? AND status='queued'", (job_id,))
+        if cursor.rowcount == 1:
+            return True
+        with self._lock:
+            if int(job_id) not in self._running:
+                return False
+            self._cancelled.add(int(job_id))
+            process = self._processes.get(int(job_id))
+        # jobs that have not started are not sent to the printer
+        if process is not None:
+            process.terminate()
+        return True
+
+    def _queue(self, printer, db_conn):
+        """Return the queue of the printer, starting its thread if needed."""
+        with self._lock:
+            if printer not in self.queues:
+                self.queues[printer] = queue.Queue()
+                # the thread uses its own connection to the same database
+                source = getattr(db_conn, 'database', None) or database.database_path(db_conn)
+                threading.Thread(target=self._run, args=(source, self.queues[printer]),
+                                 name='spooler-{0}'.format(printer), daemon=True).start()
+            return self.queues[printer]
+
+    def _run(self, source, jobs):
+        """Run the queued jobs of one printer, one at a time.
+
+        A job that cannot be run, e.g. because the database is locked or the job is missing, is
+        marked `failed` and the next job is run.
+
+        """
+        if isinstance(source, str):
+            db_conn = sqlite3.connect(source)
+        else:
+            db_conn = source.connection()
+        while True:
+            job_id = jobs.get()
+            try:
+                self._print(db_conn, job_id)
+            except Exception as error:
+                print('Print job, {0}, failed: {1}'.format(job_id, error))
+                try:
+                    with database.transaction(db_conn):
+                        db_conn.execute('UPDATE print_jobs SET status=?, finished=?, error=? '
+                                        'WHERE id=?',
+                                        ('failed', migrations.format_time(datetime.datetime.now()),
+                                         str(error), job_id))
+                except sqlite3.Error as db_error:
+                    print('Print job, {0}, could not be marked as failed: {1}'
+                          ''.format(job_id, db_error))
+
+    def _print(self, db_conn, job_id):
+        """Send the print job to the printer and record how it ended."""
+        # registered before the job leaves the queued status, so that it can always be cancelled
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            self._send(db_conn, job_id)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+                self._cancelled.discard(job_id)
+
+    def _send(self, db_conn, job_id):
+        """Run the command of the print job, unless it is cancelled, and record how it ended."""
+        cursor = db_conn.cursor()
+        with database.transaction(db_conn):
+            cursor.execute("UPDATE print_jobs SET status='printing' "
+                           "WHERE id=? AND status='queued'", (job_id,))
+        # cancelled before it started
+        if cursor.rowcount != 1:
+            return
+        cursor.execute('SELECT command FROM print_jobs WHERE id=?', (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise LookupError('The print job was removed from the database.')
+        command = json.loads(row[0])
+
+        error = None
+        process = None
+        with self._lock:
+            if job_id in self._cancelled:
+                status = 'cancelled'
+            else:
+                try:
+                    process = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                                               stderr=subprocess.PIPE)
+                except OSError as os_error:
+                    status = 'failed'
+                    error = str(os_error)
+                else:
+                    self._processes[job_id] = process
+        if process is not None:
+            error = process.communicate()[1].decode(errors='replace').strip()
+            with self._lock:
+                del self._processes[job_id]
+                if job_id in self._cancelled:
+                    status = 'cancelled'
+                elif process.returncode == 0:
+                    status = 'done'
+                else:
+                    status = 'failed'
+
+        with database.transaction(db_conn):
+            cursor.execute('UPDATE print_jobs SET status=?, finished=?, error=? WHERE id=?',
+                           (status, migrations.format_time(datetime.datetime.now()),
+                            error or None, job_id))
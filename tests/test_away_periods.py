@@ -0,0 +1,65 @@
+"""Tests for the away periods of the members."""
+import datetime
+import os
+import sqlite3
+import sys
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from action import ActionInputError  # noqa: E402
+import members  # noqa: E402
+import migrations  # noqa: E402
+from suite import load_group_meeting  # noqa: E402
+
+
+@pytest.fixture
+def db_conn():
+    """Database with an administrator and a member."""
+    db_conn = sqlite3.connect(':memory:')
+    migrations.migrate(db_conn)
+    db_conn.executemany('INSERT INTO members (name, userid, slack_id, permission) VALUES (?,?,?,?)',
+                        [('Admin', 'admin', 'UADMIN', 'admin'), ('Away', 'away', 'UAWAY', 'user')])
+    db_conn.commit()
+    yield db_conn
+    db_conn.close()
+
+
+def set_dates_away(db_conn, dates_away):
+    """Set the dates away of the member as the administrator."""
+    with pytest.raises(ActionInputError):
+        members.modify(db_conn, 'admin', 'dates_away', dates_away, 'userid', 'away')
+
+
+def test_away_periods():
+    assert migrations.away_periods('') == []
+    assert migrations.away_periods(None) == []
+    assert (migrations.away_periods('2020-03-01 to 2020-03-05, 2020-01-02 and 2020-01-01') ==
+            [('2020-01-01', '2020-01-02'), ('2020-03-01', '2020-03-05')])
+    # the last date has no pair
+    assert migrations.away_periods('2020-01-01 2020-01-02 2020-02-01') == [('2020-01-01',
+                                                                            '2020-01-02')]
+
+
+def test_modify_dates_away(db_conn):
+    set_dates_away(db_conn, '2020-01-01 2020-01-10 2020-02-01 2020-02-03')
+    assert (db_conn.execute('SELECT member, start, end FROM away_periods ORDER BY start')
+            .fetchall() == [(2, '2020-01-01', '2020-01-10'), (2, '2020-02-01', '2020-02-03')])
+    # the periods are replaced
+    set_dates_away(db_conn, '2021-05-01 2021-05-02')
+    assert (db_conn.execute('SELECT member, start, end FROM away_periods').fetchall() ==
+            [(2, '2021-05-01', '2021-05-02')])
+
+
+def test_away_member_not_selected(db_conn):
+    GroupMeeting = load_group_meeting()[0]
+    meetings = GroupMeeting(db_conn)
+    today = datetime.date.today()
+    assert {meetings.select_member_random(today, 'presenter') for _ in range(50)} == {1, 2}
+
+    set_dates_away(db_conn, '{0} {1}'.format(today - datetime.timedelta(days=1),
+                                             today + datetime.timedelta(days=1)))
+    assert {meetings.select_member_random(today, 'presenter') for _ in range(50)} == {1}
+    # the period is over
+    later = today + datetime.timedelta(days=2)
+    assert {meetings.select_member_random(later, 'presenter') for _ in range(50)} == {1, 2}
@@ -0,0 +1,218 @@
+"""Module for timing the stages of the commands of the bot.
+
+Durations are counted in histograms with logarithmic buckets, so that the memory used does not grow
+with the number of commands and the percentiles can be estimated at any time. Timing is off until
+`enable` is called, and each timed stage then costs two calls to `time.perf_counter`.
+
+Stages that happen many times within a command, such as SQL statements, are added up with
+`accumulate` while the command runs in the calling thread, and each total is counted once when the
+command ends. The stages that come before the command is known, parsing the message and finding
+the user, are counted under the next command run by the thread, and the other stages that happen
+outside of a command are not counted.
+
+"""
+import bisect
+import math
+import threading
+
+# upper bounds of the buckets in seconds, from 10 microseconds to about 10 minutes, ten per decade
+BOUNDS = [10 ** (i / 10) * 1e-5 for i in range(79)]
+# stages that are counted under the next command when they happen outside of a command
+PENDING_STAGES = ('parse', 'identity')
+
+enabled = False
+histograms = {}
+_lock = threading.Lock()
+# command that each thread is running and the totals of its accumulated stages
+_local = threading.local()
+
+
+class Histogram(object):
+    """Counts of durations in logarithmic buckets.
+
+    Attributes
+    ----------
+    counts : list of int
+        Number of durations in each bucket of `BOUNDS`, and one more for the longer durations.
+    count : int
+        Number of durations.
+    total : float
+        Sum of the durations in seconds.
+    max : float
+        Longest duration in seconds.
+
+    """
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Count the given duration."""
+        self.counts[bisect.bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket that contains the given percentile.
+
+        Parameters
+        ----------
+        percent : float
+            Percentile between 0 and 100.
+
+        Returns
+        -------
+        seconds : float
+            Estimate of the percentile, which is never more than the longest duration.
+
+        """
+        rank = max(1, int(math.ceil(self.count * percent / 100)))
+        seen = 0
+        for bound, count in zip(BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+def enable(on=True):
+    """Turn the timing of the commands on or off.
+
+    Parameters
+    ----------
+    on : bool
+        True to time the commands.
+
+    """
+    global enabled
+    enabled = on
+
+
+def record(key, stage, seconds):
+    """Count the duration of a stage of a command.
+
+    Parameters
+    ----------
+    key : str
+        Path of the command, e.g. `money list`.
+    stage : str
+        Stage of the command, e.g. `lookup` or `run`.
+    seconds : float
+        Duration of the stage.
+
+    """
+    with _lock:
+        histogram = histograms.get((key, stage))
+        if histogram is None:
+            histogram = histograms[(key, stage)] = Histogram()
+        histogram.add(seconds)
+
+
+def begin(key):
+    """Start accumulating the stages of a command in the calling thread.
+
+    Stages that were accumulated before the command started are counted under the command.
+
+    Parameters
+    ----------
+    key : str
+        Path of the command, e.g. `money list`.
+
+    Returns
+    -------
+    previous : tuple
+        State of the command that was already running in the thread, to be given to `end`.
+
+    """
+    previous = (getattr(_local, 'key', None), getattr(_local, 'totals', None))
+    _local.key = key
+    # stages that happened before any command, e.g. parsing the message
+    _local.totals = getattr(_local, 'pending', None) or {}
+    _local.pending = None
+    return previous
+
+
+def end(previous):
+    """Count the accumulated stages of the command of the calling thread.
+
+    Parameters
+    ----------
+    previous : tuple
+        State that was returned by `begin`.
+
+    """
+    key, totals = getattr(_local, 'key', None), getattr(_local, 'totals', None)
+    _local.key, _local.totals = previous
+    # the reply to a command is sent after it ends
+    _local.last = key
+    for stage, seconds in (totals or {}).items():
+        record(key, stage, seconds)
+
+
+def current():
+    """Return the path of the command that the calling thread is running, or that it last ran.
+
+    Returns
+    -------
+    key : str
+        Path of the command.
+        None if the thread has not run a command.
+
+    """
+    return getattr(_local, 'key', None) or getattr(_local, 'last', None)
+
+
+def accumulate(stage, seconds):
+    """Add to the duration of a stage of the command that the calling thread is running.
+
+    If no command is running, the durations of `PENDING_STAGES` are counted under the next command
+    of the thread, and the others are dropped.
+
+    Parameters
+    ----------
+    stage : str
+        Stage of the command, e.g. `sql`.
+    seconds : float
+        Duration that is added.
+
+    """
+    totals = getattr(_local, 'totals', None)
+    if totals is None:
+        if stage not in PENDING_STAGES:
+            return
+        totals = _local.pending = getattr(_local, 'pending', None) or {}
+    totals[stage] = totals.get(stage, 0.0) + seconds
+
+
+def reset():
+    """Forget all the durations."""
+    with _lock:
+        histograms.clear()
+
+
+def summary():
+    """Return a table of the counts and percentiles of each stage of each command.
+
+    Returns
+    -------
+    message : str
+        One line for each command and stage, with the durations in milliseconds.
+
+    """
+    with _lock:
+        rows = [(key, stage, histogram.count, histogram.percentile(50), histogram.percentile(95),
+                 histogram.percentile(99), histogram.max)
+                for (key, stage), histogram in sorted(histograms.items())]
+    if not rows:
+        return 'No commands have been timed.' if enabled else 'Timing of the commands is off.'
+    line = '{0:<30}{1:<10}{2:>8}{3:>10}{4:>10}{5:>10}{6:>10}'
+    lines = [line.format('command', 'stage', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms')]
+    for key, stage, count, *seconds in rows:
+        lines.append(line.format(key or '-', stage, count,
+                                *('{0:.3f}'.format(i * 1e3) for i in seconds)))
+    return '\n'.join(lines)
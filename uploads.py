@@ -0,0 +1,104 @@
+"""Module for storing the files that are uploaded to the bot.
+
+Files are streamed to disk in fixed size chunks and are stored under the SHA-256 digest of their
+content, so that identical uploads are stored only once. The uploads table maps the name of each
+upload to its digest, and the latest upload of a name is the one that is used.
+
+"""
+import datetime
+import hashlib
+import os
+import tempfile
+import database
+import migrations
+
+UPLOAD_DIR = os.path.join(tempfile.gettempdir(), 'ayerslab_bot')
+CHUNK_SIZE = 64 * 1024
+MAX_SIZE = 50 * 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Exception raised when the uploaded file is larger than the allowed size."""
+    pass
+
+
+def store(db_conn, name, stream, max_size=MAX_SIZE, directory=UPLOAD_DIR):
+    """Store the content of the stream under the given name.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+    name : str
+        Name of the uploaded file.
+    stream : file-like object
+        Binary stream of the content of the file.
+    max_size : int
+        Maximum number of bytes in the file.
+    directory : str
+        Directory in which the files are stored.
+
+    Returns
+    -------
+    digest : str
+        SHA-256 digest of the content of the file.
+
+    Raises
+    ------
+    UploadTooLarge
+        If the file has more than `max_size` bytes.
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    sha = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as fh:
+        try:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge('The file is larger than {0} bytes.'.format(max_size))
+                sha.update(chunk)
+                fh.write(chunk)
+        except BaseException:
+            fh.close()
+            os.remove(fh.name)
+            raise
+
+    digest = sha.hexdigest()
+    if os.path.exists(os.path.join(directory, digest)):
+        os.remove(fh.name)
+    else:
+        os.replace(fh.name, os.path.join(directory, digest))
+
+    with database.transaction(db_conn) as write_conn:
+        write_conn.execute('INSERT INTO uploads (name, digest, size, time) VALUES (?,?,?,?)',
+                           (name, digest, size, migrations.format_time(datetime.datetime.now())))
+    return digest
+
+
+def path(db_conn, name, directory=UPLOAD_DIR):
+    """Return the path to the latest file that was uploaded with the given name.
+
+    Parameters
+    ----------
+    db_conn : sqlite3.Connection
+        Database connection object.
+    name : str
+        Name of the uploaded file.
+    directory : str
+        Directory in which the files are stored.
+
+    Returns
+    -------
+    path : str
+        Path to the stored file.
+        None if no file was uploaded with the given name.
+
+    """
+    cursor = db_conn.cursor()
+    cursor.execute('SELECT digest FROM uploads WHERE name=? ORDER BY id DESC LIMIT 1', (name,))
+    row = cursor.fetchone()
+    if row is None or not os.path.exists(os.path.join(directory, row[0])):
+        return None
+    return os.path.join(directory, row[0])